@@ -4,15 +4,49 @@
 
 from datetime import datetime
 from app_init import app
-from dash_layouts import main_layout
+from dash_layouts import main_layout, build_layout
 import dash_callbacks
+import utilities
 import os
 
 app.title = "Mountain Goats"
 server = app.server
 
 local = os.path.exists('_local')
-app.layout = main_layout(local)
+
+# Settings are read once, and re-read when edited in local mode
+utilities.settings.reload = local
+
+# Server-side data cache, on disk when deployed so that workers share it
+if not local:
+    utilities.datastore.use(utilities.DiskBackend('cache'))
+
+# Layout built per page load, no data read at import. Callbacks are validated against an empty one.
+app.validation_layout = build_layout(utilities.Dataset.empty(utilities.settings.metadata), local)
+app.layout = lambda: main_layout(local)
+
+# Responses: serialized with orjson, json ones compressed as the browser accepts (gzip, brotli when installed)
+utilities.use_json_engine(os.environ.get('MOUNTAIN_GOATS_JSON_ENGINE', 'orjson'))
+if os.environ.get('MOUNTAIN_GOATS_COMPRESS', '1') != '0':
+    utilities.compress(app)
+
+# Responses keyed by data version when deployed: layout, dependencies and deterministic callbacks are
+# served from the cache, with ETags (304 when the browser holds the same content)
+if not local and os.environ.get('MOUNTAIN_GOATS_RESPONSE_CACHE', '1') != '0':
+    utilities.cache_responses(app, utilities.datastore.current, dash_callbacks.CACHEABLE_OUTPUTS)
+
+# Opt-in timings of callbacks and figure builders, on /metrics for requests bearing MOUNTAIN_GOATS_METRICS_TOKEN.
+# Profiles of callbacks slower than MOUNTAIN_GOATS_PROFILE seconds are saved in profiles/
+if os.environ.get('MOUNTAIN_GOATS_METRICS'):
+    utilities.instrument(
+        app,
+        profile_threshold = float(os.environ.get('MOUNTAIN_GOATS_PROFILE', 0)) or None,
+        token             = os.environ.get('MOUNTAIN_GOATS_METRICS_TOKEN'),
+    )
+
+# Default figures precomputed in the background when deployed, in every language: /ready answers 200 once done
+if not local and os.environ.get('MOUNTAIN_GOATS_WARM_UP', '1') != '0':
+    utilities.warm_up.start(app, dash_callbacks.WARM_UP_PAGES)
 
 if __name__ == '__main__':
     
@@ -0,0 +1,78 @@
+// Clientside callbacks: UI toggles and activities table, no round-trip to the server
+// ----------------------------------------------------------------------------
+
+// Activities table in remote mode: the DashTabulator component (known from its first request)
+// and the data version, waypoint filter and language it shows
+var activities_table = {component: null, shown: null};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+
+    mountain_goats: {
+
+        // Switch tab
+        switch_layout: function(layout) {
+
+            var hidden = {'display': 'none'};
+
+            return [
+                (layout === 'map' || layout == null) ? {} : hidden,
+                layout === 'activities'              ? {} : hidden,
+                layout === 'stats'                   ? {} : hidden,
+            ];
+        },
+
+        // Switch stats
+        switch_stats: function(stat) {
+
+            var hidden = {'display': 'none'};
+
+            return [
+                (stat === 'stats_places' || stat == null) ? {} : hidden,
+                stat === 'stats_year'                     ? {} : hidden,
+                stat === 'stats_grade'                    ? {} : hidden,
+                stat === 'stats_context'                  ? {} : hidden,
+            ];
+        },
+
+        // Page of the activities table (ajaxRequestFunc): page, size, sorters and filters from Tabulator
+        activities_request: function(url, config, params, component) {
+
+            activities_table.component = component;
+
+            return fetch(url, {
+                method : 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body   : JSON.stringify(Object.assign({}, params, activities_table.shown)),
+            }).then(function(response) {
+                return response.ok ? response.json() : Promise.reject(response.statusText);
+            });
+        },
+
+        // Show another data version (same page, e.g. after a save), or another filter/language (first page)
+        reload_activities: function(version, filter, language) {
+
+            var shown = {version: version, filter: filter || null, language: language};
+            var component = activities_table.component;
+            var before = activities_table.shown || (component && component.props.options.ajaxParams);
+
+            activities_table.shown = shown;
+
+            if (component && component.ref && component.ref.table && before) {
+                var table = component.ref.table;
+
+                if (before.filter !== shown.filter || before.language !== shown.language) {
+                    table.setData();
+                } else if (before.version !== shown.version) {
+                    table.setPage(table.getPage());
+                }
+            }
+
+            return shown;
+        },
+
+        // Display filters
+        toggle: function(n, is_open) {
+            return !is_open;
+        },
+    }
+});
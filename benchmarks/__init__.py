@@ -0,0 +1,6 @@
+'''
+Synthetic datasets and benchmarks, run from the repository root:
+
+    python -m benchmarks.generate 10000 --directory bench_data
+    python -m benchmarks.run --sizes 1000 10000 100000 --save
+'''
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+import pandas as pd
+import yaml
+import utilities
+
+
+# Massifs places are drawn around: name, latitude, longitude, spread (degrees)
+MASSIFS = [
+    ('Mont Blanc',       45.83,  6.86, 0.15),
+    ('Ecrins',           44.92,  6.36, 0.20),
+    ('Vanoise',          45.38,  6.82, 0.20),
+    ('Grand Paradis',    45.52,  7.27, 0.15),
+    ('Valais',           46.02,  7.70, 0.25),
+    ('Oberland',         46.55,  8.00, 0.20),
+    ('Bernina',          46.38,  9.90, 0.15),
+    ('Dolomites',        46.50, 11.85, 0.30),
+]
+
+# Altitude of places by category: mean, standard deviation, minimum (meters). Nothing above Mont Blanc.
+ALTITUDES = {
+    'summit': (3100, 650, 1200),
+    'pass'  : (2500, 450,  900),
+    'hut'   : (2450, 400, 1000),
+    'POI'   : (1500, 500,  400),
+    'cliff' : (1700, 550,  400),
+}
+
+
+#------------------------------------------------------------------------------------------------------------
+def generate_places(
+    count     : int,
+    categories: list,
+    seed      = 0,
+) -> pd.DataFrame:
+    '''
+    Places scattered around the alpine massifs, with a plausible altitude for their category
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    massif = rng.integers(0, len(MASSIFS), count)
+    category = rng.choice(categories, count, p=[0.35, 0.2, 0.2, 0.15, 0.1] if len(categories)==5 else None)
+
+    names, lat, lon, spread = (np.array(column) for column in zip(*MASSIFS))
+    mean, deviation, minimum = (
+        np.array([ALTITUDES.get(cat, (2000, 600, 400))[position] for cat in category])
+        for position in range(3)
+    )
+
+    return pd.DataFrame({
+        'waypoint' : [f'{names[m]} {cat} {i}' for i, (m, cat) in enumerate(zip(massif, category))],
+        'latitude' : np.round(rng.normal(lat[massif], spread[massif]), 5),
+        'longitude': np.round(rng.normal(lon[massif], spread[massif] * 1.4), 5),
+        'altitude' : np.clip(rng.normal(mean, deviation), minimum, 4808).round().astype(int),
+        'category' : category,
+    })
+
+
+def generate_activities(
+    count   : int,
+    places  : pd.DataFrame,
+    metadata: dict,
+    seed    = 0,
+) -> pd.DataFrame:
+    '''
+    Activities of every sport and grade, visiting 1 to 4 places each (some places are far more popular)
+    '''
+
+    rng = np.random.default_rng(seed + 1)
+
+    sports = list(metadata['activity'])
+    category = rng.choice(sports, count)
+    grade = np.empty(count, dtype=object)
+    for sport in sports:
+        rows = np.flatnonzero(category==sport)
+        grade[rows] = rng.choice(list(metadata['activity'][sport]['grades']), len(rows))
+
+    days = rng.choice([0.5, 1, 1, 1, 1, 2, 2, 3, 5], count)
+    start = np.datetime64('2000-01-01')
+    dates = start + rng.integers(0, (np.datetime64('2024-01-01') - start).astype(int), count)
+
+    popularity = 1 / np.arange(1, len(places) + 1) ** 0.8
+    visited = rng.choice(places['waypoint'].to_numpy(), (count, 4), p=popularity / popularity.sum())
+    visits = rng.integers(1, 5, count)
+
+    return pd.DataFrame({
+        'id'          : np.arange(count),
+        'label'       : [f'{visited[i, 0]} ({category[i]})' for i in range(count)],
+        'category'    : category,
+        'grade'       : grade,
+        'date'        : pd.Series(dates).dt.strftime('%Y-%m-%d'),
+        'days'        : days,
+        'context'     : rng.choice(metadata['context'], count),
+        'role'        : rng.choice(metadata['role'] + [None], count),
+        'waypoints'   : [', '.join(dict.fromkeys(visited[i, :visits[i]])) for i in range(count)],
+        'participants': rng.integers(1, 7, count),
+        'topo'        : [f'https://www.camptocamp.org/routes/{i}' for i in range(count)],
+        'comments'    : None,
+    })
+
+
+#------------------------------------------------------------------------------------------------------------
+def generate(
+    activities: int,
+    places    : int = None,
+    directory = '.',
+    seed      = 0,
+) -> dict:
+    '''
+    Write data_places.json / data_activities.json in directory, same format as the app's data.
+    Same arguments, same files. Default: one place for 10 activities (at least 100).
+    '''
+
+    places = places or max(100, activities // 10)
+
+    with open(os.path.join(utilities.settings.directory, 'color_settings.yaml')) as file:
+        categories = list(yaml.load(file, Loader=yaml.FullLoader)['places'])
+
+    places = generate_places(places, categories, seed)
+    activities = generate_activities(activities, places, utilities.settings.metadata, seed)
+
+    paths = {
+        'places'    : os.path.join(directory, 'data_places.json'),
+        'activities': os.path.join(directory, 'data_activities.json'),
+    }
+    os.makedirs(directory, exist_ok=True)
+    places.to_json(paths['places'], orient='table', index=False)
+    activities.to_json(paths['activities'], orient='table', index=False)
+
+    return paths
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset')
+    parser.add_argument('activities', type=int)
+    parser.add_argument('--places', type=int, default=None)
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    print(generate(arguments.activities, arguments.places, arguments.directory, arguments.seed))
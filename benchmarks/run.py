@@ -0,0 +1,379 @@
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from plotly.io.json import to_json_plotly
+import utilities
+from benchmarks.generate import generate
+
+
+LANGUAGE = 'fr'
+
+# Differences below these are noise, never reported as regressions: seconds, bytes, bytes
+NOISE = {'time': 0.02, 'memory': 2**20, 'payload': 1024}
+
+
+#------------------------------------------------------------------------------------------------------------
+def payload_size(
+    value
+) -> int:
+    '''
+    Bytes sent to the browser: body of a response (as encoded), serialized figure(s). None for data.
+    '''
+
+    if hasattr(value, 'data') and hasattr(value, 'status_code'):
+        return len(value.data)
+    if isinstance(value, str):
+        return len(value.encode())
+    if hasattr(value, 'to_plotly_json') or isinstance(value, dict):
+        return len(to_json_plotly(value))
+
+    return None
+
+
+def measure(
+    call,
+    repeat = 3,
+    setup  = None,
+) -> dict:
+    '''
+    Median wall time (s) over repeat runs, then one more run under tracemalloc for the peak memory (bytes)
+    '''
+
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = call()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'time'   : statistics.median(times),
+        'memory' : peak,
+        'payload': payload_size(result),
+    }
+
+
+#------------------------------------------------------------------------------------------------------------
+class Client:
+    '''
+    Fires callbacks like the browser does, through the Flask test client: values come from the page
+    layout, overridden per call. encoding: Accept-Encoding of the callback requests.
+    '''
+
+    def __init__(
+        self,
+        app,
+        encoding = None,
+    ):
+        self.client = app.server.test_client()
+        self.headers = {'Accept-Encoding': encoding} if encoding else {}
+        self.dependencies = json.loads(self.client.get('/_dash-dependencies').data)
+        self.props = {}
+        self.walk(json.loads(self.client.get('/_dash-layout').data))
+
+    def walk(
+        self,
+        node
+    ):
+        if isinstance(node, list):
+            for child in node:
+                self.walk(child)
+
+        elif isinstance(node, dict) and 'props' in node and 'type' in node:
+            props = node['props']
+            if 'id' in props:
+                self.props.update({(props['id'], key): value for key, value in props.items()})
+            for value in props.values():
+                if isinstance(value, (dict, list)):
+                    self.walk(value)
+
+    def fire(
+        self,
+        output: str,
+        values: dict = None,
+    ):
+        '''
+        Response of the server-side callback with that output (e.g. 'place_map.figure')
+        '''
+
+        values = values or {}
+        dependency = next(
+            dependency for dependency in self.dependencies
+            if output in dependency['output'].strip('.').split('...')
+            if dependency.get('clientside_function') is None
+        )
+
+        def value(item):
+            key = (item['id'], item['property'])
+            return values[key] if key in values else self.props.get(key)
+
+        outputs = []
+        for item in dependency['output'].strip('.').split('...'):
+            id, property = item.rsplit('.', 1)
+            outputs.append({'id': id, 'property': property.split('@')[0]})
+
+        response = self.client.post('/_dash-update-component', headers=self.headers, json={
+            'output'        : dependency['output'],
+            'outputs'       : outputs if dependency['output'].startswith('..') else outputs[0],
+            'inputs'        : [dict(item, value=value(item)) for item in dependency['inputs']],
+            'state'         : [dict(item, value=value(item)) for item in dependency['state']],
+            'changedPropIds': [f"{item['id']}.{item['property']}" for item in dependency['inputs']],
+        })
+        assert response.status_code in (200, 204), (output, response.status_code, response.data[:500])
+
+        return response
+
+
+    def page(
+        self,
+        page: int,
+    ):
+        '''
+        Page of the activities table, as requested by the table (remote mode)
+        '''
+
+        options = self.props[('activities_tabulator', 'options')]
+        response = self.client.post(options['ajaxURL'], headers=self.headers, json=dict(options['ajaxParams'], page=page, size=options['paginationSize']))
+        assert response.status_code == 200, ('activities_page', response.status_code, response.data[:500])
+
+        return response
+
+
+#------------------------------------------------------------------------------------------------------------
+def figure_cases(
+    dataset: utilities.Dataset
+) -> dict:
+    '''
+    Each figure builder of utilities/figures.py, with its inputs as the callbacks prepare them
+    '''
+
+    places = dataset.places_for(LANGUAGE)
+    altitudes = (places['altitude'].min(), places['altitude'].max())
+    categories = list(places['category'].unique())
+    aggregates = dataset.aggregates()
+
+    return {
+        'activities_yearly_summary': lambda: utilities.activities_yearly_summary(aggregates.days_for(LANGUAGE), False, LANGUAGE),
+        'places_yearly_summary'    : lambda: utilities.places_yearly_summary(aggregates.waypoints_for(LANGUAGE), LANGUAGE),
+        'contexts_yearly_summary'  : lambda: utilities.contexts_yearly_summary(aggregates.contexts_for(LANGUAGE), LANGUAGE),
+        'grades_overtime'          : lambda: utilities.grades_overtime(dataset.activities_for(LANGUAGE), LANGUAGE),
+        'waypoints_by_altitude'    : lambda: utilities.waypoints_by_altitude(dataset.places_by_altitude(LANGUAGE), altitudes, categories, LANGUAGE),
+        'waypoints_by_year'        : lambda: utilities.waypoints_by_year(dataset.waypoints_overtime(LANGUAGE), altitudes, categories, LANGUAGE),
+        'create_map'               : lambda: utilities.create_map(places, LANGUAGE),
+    }
+
+
+def callback_cases(
+    client: Client
+) -> dict:
+    '''
+    Server-side callbacks, as fired when their tab is displayed
+    '''
+
+    stats = {('navigation_segments', 'value'): 'stats'}
+
+    cases = {
+        'update_places_totals'       : ('summits_total.children', {}),
+        'update_activities_totals'   : ('activities_total.children', {}),
+        'update_map'                 : ('place_map.figure', {('navigation_segments', 'value'): 'map'}),
+        'update_activities_plot'     : ('activities_plot.figure', {**stats, ('stats_segments', 'value'): 'stats_year'}),
+        'update_grades_overtime'     : ('grades_overtime.children', {**stats, ('stats_segments', 'value'): 'stats_grade'}),
+        'update_context_overtime'    : ('context_overtime.figure', {**stats, ('stats_segments', 'value'): 'stats_context'}),
+    }
+    for switch in ['curve', 'year_summary', 'trivia', 'exploded_view']:
+        cases[f'update_places_plot[{switch}]'] = ('places_plot.figure', {**stats, ('places_plot_switch', 'value'): switch})
+
+    cases = {name: (lambda output=output, values=values: client.fire(output, values)) for name, (output, values) in cases.items()}
+    cases['activities_page'] = lambda: client.page(1)
+
+    return cases
+
+
+def save_cases(
+    client: Client
+) -> dict:
+    '''
+    Save callbacks: a new place, a new activity (each run saves a new one)
+    '''
+
+    runs = iter(range(10**6))
+    place = client.props[('new_activity_waypoints', 'data')][0]
+
+    return {
+        'save_new_place': lambda: client.fire('places_store.data', {
+            ('save_new_place',      'n_clicks'): 1,
+            ('new_place_name',      'value'   ): f'Benchmark place {next(runs)}',
+            ('new_place_latitude',  'value'   ): 45.9,
+            ('new_place_longitude', 'value'   ): 6.9,
+            ('new_place_altitude',  'value'   ): 3000,
+            ('new_place_category',  'value'   ): 'summit',
+        }),
+        'save_new_activity': lambda: client.fire('alert_new_activity_saved.hide', {
+            ('save_new_activity',         'n_clicks'        ): 1,
+            ('new_activity_label',        'value'           ): f'Benchmark activity {next(runs)}',
+            ('new_activity_category',     'value'           ): 'hike',
+            ('new_activity_grade',        'value'           ): 'T3',
+            ('new_activity_date',         'value'           ): '2023-07-14',
+            ('new_activity_days',         'value'           ): 1,
+            ('new_activity_context',      'value'           ): 'friends',
+            ('new_activity_role',         'value'           ): 'participant',
+            ('new_activity_waypoints',    'value'           ): [place],
+            ('new_activity_participants', 'value'           ): 2,
+            ('activities_tabulator',      'multiRowsClicked'): [],
+        }),
+    }
+
+
+#------------------------------------------------------------------------------------------------------------
+def run_size(
+    app,
+    size  : int,
+    repeat: int,
+) -> dict:
+    '''
+    All cases on a generated dataset of that many activities, in a temporary directory
+    '''
+
+    results = {}
+    root = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate(size, directory=directory)
+        os.chdir(directory)
+
+        try:
+            results.update(run_cases(app, repeat))
+        finally:
+            os.chdir(root)
+
+    return results
+
+
+def run_cases(
+    app,
+    repeat: int,
+) -> dict:
+
+    results = {}
+
+    # Deployed setup: datasets cached on disk, next to the data
+    utilities.datastore.use(utilities.DiskBackend('cache'))
+
+    results['load_data'] = measure(lambda: utilities.load_data(utilities.settings.metadata), repeat)
+
+    # Startup: the json files are compiled to the binary snapshot once, then read from it
+    storage = utilities.JsonStorage()
+    storage.load(utilities.settings.metadata)
+    results['load_snapshot'] = measure(lambda: storage.load(utilities.settings.metadata), repeat)
+
+    dataset = utilities.datastore.get(utilities.datastore.current())
+    # Figures built, then serialized by each json engine
+    for name, call in figure_cases(dataset).items():
+        results[name] = measure(call, repeat)
+        figure = call()
+        for engine in ['json', 'orjson']:
+            results[f'{name}[{engine}]'] = measure(lambda: to_json_plotly(figure, engine=engine), repeat)
+
+    client = Client(app)
+    stores = [client.props[('places_store', 'data')], client.props[('activities_store', 'data')]]
+    expire = lambda: [utilities.figure_cache.expire(store) for store in stores]
+    for name, call in callback_cases(client).items():
+        results[name] = measure(call, repeat, setup=expire)
+
+    # Same responses, compressed as negotiated with the browser: bytes on the wire
+    for encoding in utilities.transport.encodings():
+        for name, call in callback_cases(Client(app, encoding)).items():
+            results[f'{name}[{encoding}]'] = measure(call, repeat, setup=expire)
+
+    for name, call in save_cases(client).items():
+        results[name] = measure(call, repeat)
+
+    return results
+
+
+def compare(
+    results  : dict,
+    baseline : dict,
+    tolerance: float,
+) -> list:
+    '''
+    Print results next to the baseline. Returns the regressions: metric more than tolerance times
+    its baseline value (plus noise).
+    '''
+
+    regressions = []
+    units = {'time': (1e3, 'ms'), 'memory': (2**-20, 'MB'), 'payload': (2**-10, 'KB')}
+
+    print(f"{'case':45}" + ''.join(f'{f"{metric} ({unit})":>22}' for metric, (_, unit) in units.items()))
+
+    for case, metrics in results.items():
+        line = f'{case:45}'
+        for metric, (scale, _) in units.items():
+            value = metrics[metric]
+            before = baseline.get(case, {}).get(metric)
+            if value is None:
+                line += f'{"-":>22}'
+                continue
+            cell = f'{value * scale:.1f}'
+            if before:
+                ratio = value / before
+                cell += f' ({ratio:.2f}x)'
+                if value > before * tolerance + NOISE[metric]:
+                    cell += ' !'
+                    regressions.append((case, metric, ratio))
+            line += f'{cell:>22}'
+        print(line)
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark data loading, figure builders and callbacks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='number of activities, up to 1000000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=os.path.join('benchmarks', 'baseline.json'))
+    parser.add_argument('--save', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='ratio to the baseline reported as a regression')
+    arguments = parser.parse_args()
+
+    # Settings stay in the repository, data goes to temporary directories.
+    # Callbacks and figures are measured, not the response cache nor the warm-up of the deployed app.
+    utilities.settings.directory = os.path.abspath(utilities.settings.directory)
+    os.environ['MOUNTAIN_GOATS_RESPONSE_CACHE'] = '0'
+    os.environ['MOUNTAIN_GOATS_WARM_UP'] = '0'
+    from app import app
+
+    results = {}
+    for size in arguments.sizes:
+        for case, metrics in run_size(app, size, arguments.repeat).items():
+            results[f'{size}/{case}'] = metrics
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+
+    regressions = compare(results, baseline, arguments.tolerance)
+
+    if arguments.save:
+        with open(arguments.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if regressions:
+        print(f'{len(regressions)} regression(s) above {arguments.tolerance}x the baseline')
+        sys.exit(1)
@@ -1,78 +1,46 @@
-from dash import Input, Output, State, ctx, dcc
+from dash import Input, Output, State, ClientsideFunction, ctx, dcc, no_update
+from dash.exceptions import PreventUpdate
 from dash import html
 from app_init import app
 import utilities
+import numpy as np
 import pandas as pd
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 import dash_bootstrap_components as dbc
-import math
 from functools import reduce
+from plotly.io.json import to_json_plotly
+import flask
 
 
-# Switch tab
+# Data versions come from the browser: malformed ones are refused (see utilities.check_version)
 #----------------------------------------------------------------------------
-@app.callback(
+@app.server.errorhandler(utilities.InvalidVersion)
+def invalid_version(error):
+
+    return flask.Response(str(error), status=400, mimetype='text/plain')
+
+
+# Switch tab, clientside (assets/clientside.js)
+#----------------------------------------------------------------------------
+app.clientside_callback(
+    ClientsideFunction(namespace='mountain_goats', function_name='switch_layout'),
     [Output('map_content',        'style'),
      Output('activities_content', 'style'),
      Output('stats_content',      'style')],
      Input('navigation_segments', 'value')
-    )
-def switch_layout(layout):
-
-    layout_map        = {'display': 'none'}
-    layout_activities = {'display': 'none'}
-    layout_stats      = {'display': 'none'}
-
-    if layout=='map' or layout==None:
-        layout_map={}
-    
-    elif layout=='activities':
-        layout_activities = {}
-    
-    elif layout=='stats':
-        layout_stats = {}
-
-    return (
-        layout_map,
-        layout_activities,
-        layout_stats
-    )
+)
 
-# Switch stats
+# Switch stats, clientside
 #----------------------------------------------------------------------------
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='mountain_goats', function_name='switch_stats'),
     [Output('stats_places',   'style'),
      Output('stats_year',     'style'),
      Output('grades_overtime','style'),
      Output('stats_context',  'style')],
      Input ('stats_segments', 'value')
 )
-def switch_stats(stat):
-
-    layout_places  = {'display': 'none'}
-    layout_year    = {'display': 'none'}
-    layout_grade   = {'display': 'none'}
-    layout_context = {'display': 'none'}
-
-    if stat in ('stats_places', None):
-        layout_places={}
-   
-    elif stat=='stats_year':
-        layout_year = {}
-    
-    elif stat=='stats_grade':
-        layout_grade = {}
-   
-    elif stat=='stats_context':
-        layout_context = {}
-
-    return (
-        layout_places,
-        layout_year,
-        layout_grade,
-        layout_context,
-    )
 
 
 # Activity selected in tabulator, display details
@@ -90,12 +58,13 @@ def switch_stats(stat):
      Output('selected_activity_icon',      'icon'            )],
      Input ('activities_tabulator',        'multiRowsClicked'),
     [State ('places_store',                'data'            ),
+     State ('activities_store',            'data'            ),
      State ('metadata_store',              'data'            )],
     prevent_initial_call=True
 )
 def enable_save_new_place(
     row, 
-    places_store, metadata_store
+    places_store, activities_store, metadata_store
 ):
 
     if row == []:
@@ -140,9 +109,11 @@ def enable_save_new_place(
 
         activity_icon = metadata_store['icons'][row[0]['category']]
 
-        if row[0]['waypoints']:
-            selected_waypoints = row[0]['waypoints'].split(', ')
-            places = utilities.places_dict_to_df(places_store)
+        dataset = utilities.datastore.latest(places_store, activities_store)
+        selected_waypoints = dataset.index.waypoints(row[0]['id'])
+
+        if selected_waypoints:
+            places = dataset.places
             places = places[places['waypoint'].isin(selected_waypoints)].sort_values(by='altitude', ascending=False)
             places['icon'] = places['category'].map(metadata_store['icons'])
             places['color'] = places['category'].map(metadata_store['waypoint_color'])
@@ -206,7 +177,7 @@ def enable_save_new_place(
     places_store
 ):
 
-    return (name=='' or name in places_store or lat=='' or lon=='' or alt=='' or cat==None)
+    return (name=='' or utilities.datastore.get(places_store).has_place(name) or lat=='' or lon=='' or alt=='' or cat==None)
 
 
 # Activity, enable save if all required fields populated
@@ -244,6 +215,9 @@ def enable_save_activity(
 #----------------------------------------------------------------------------
 @app.callback(
     [Output('alert_new_place_saved',   'hide' ),
+     Output('alert_new_place_saved',   'title'),
+     Output('alert_new_place_saved',   'color'),
+     Output('alert_new_place_saved',   'children'),
      Output ('new_place_name',         'value'),
      Output ('new_place_latitude',     'value'),
      Output ('new_place_longitude',    'value'),
@@ -257,37 +231,55 @@ def enable_save_activity(
      State ('new_place_longitude',     'value'),
      State ('new_place_altitude',      'value'),
      State ('new_place_category',      'value'),
-     State ('places_store',            'data' )],
+     State ('places_store',            'data' ),
+     State ('activities_store',        'data' )],
     prevent_initial_call=True
 )
 def save_new_place(
     clicks, 
-    name, lat, lon, alt, cat, places_store
+    name, lat, lon, alt, cat, places_store, activities_store
 ):
 
-    # Load current data and add new one
-    places = pd.concat([
-        utilities.places_dict_to_df(places_store)[['waypoint', 'latitude','longitude', 'altitude', 'category']], 
-        pd.DataFrame([
-            {'waypoint': name, 'latitude': lat, 'longitude': lon, 'altitude': alt, 'category': cat}
-        ])
-    ]).reset_index()[['waypoint', 'latitude','longitude', 'altitude', 'category']]
+    # Add new place to current data, and save it
+    place = {'waypoint': name, 'latitude': lat, 'longitude': lon, 'altitude': alt, 'category': cat}
 
-    # Save to local file
-    places.to_json('data_places.json', orient='table', index=False)
+    try:
+        dataset = utilities.storage.commit(
+            utilities.datastore.latest(places_store, activities_store),
+            lambda dataset: dataset.has_place(name),
+            lambda dataset: dataset.add_place(place),
+            lambda dataset: utilities.storage.save_place(dataset, name),
+        )
+    
+    # Added meanwhile by another worker: show current data, keep the form
+    except utilities.WriteConflict as conflict:
+        return (
+            False,
+            'Not saved',
+            'red',
+            f'{name} was just added by someone else.',
+            no_update, no_update, no_update, no_update, no_update,
+            utilities.datastore.put(conflict.dataset),
+            no_update
+        )
+
+    utilities.figure_cache.expire(places_store)
 
     # Populate dropdown
-    places_data = places['waypoint'].unique()
+    places_data = dataset.places['waypoint'].unique()
     places_data.sort()
 
     return (
         False,
+        'Well done!',
+        'green',
+        None,
         '',
         '',
         '',
         '',
         None,
-        places.set_index('waypoint').to_dict('index'),
+        utilities.datastore.put(dataset),
         places_data
     )
 
@@ -351,7 +343,7 @@ def save_new_place(
     elif ctx.triggered_id == 'edit_activity':
 
         id = selected_activity[0]['id']
-        raw_activity = activities_store[id]
+        raw_activity = utilities.datastore.get(activities_store).activity(id)
 
         modal_title  = 'Edit this activity'
         label        = raw_activity['label']
@@ -380,6 +372,9 @@ def save_new_place(
 #----------------------------------------------------------------------------
 @app.callback(
     [Output ('alert_new_activity_saved', 'hide'    ),
+     Output ('alert_new_activity_saved', 'title'   ),
+     Output ('alert_new_activity_saved', 'color'   ),
+     Output ('alert_new_activity_saved', 'children'),
      Output ('activities_store',         'data'    )],
      Input  ('save_new_activity',        'n_clicks'),
     [State  ('new_activity_label',       'value'   ),
@@ -394,12 +389,13 @@ def save_new_place(
      State  ('new_activity_topo',        'value'   ),
      State  ('new_activity_comment',     'value'   ), 
      State  ('activities_store',         'data'    ),
-     State  ('activities_tabulator',     'multiRowsClicked')],
+     State  ('activities_tabulator',     'multiRowsClicked'),
+     State  ('places_store',             'data'    )],
     prevent_initial_call=True
 )
 def save_new_activity(
     save_clicks, 
-    label, cat, grade, start_date, days, context, role, waypoints, participants, topo, comments, activities_store, selected_activity
+    label, cat, grade, start_date, days, context, role, waypoints, participants, topo, comments, activities_store, selected_activity, places_store
 ):
 
     hide_alert = True
@@ -418,196 +414,706 @@ def save_new_activity(
         'comments'    : comments
         }
 
-    # When saving a new activity
+    # New activity: next id of the current data. Edit: conflict if it was changed meanwhile.
     if selected_activity == []:
-        id = activities_store['id'].max() + 1
-
-    # when saving changes to an existing activity
+        changed = lambda dataset: None
+        new_id = lambda dataset: int(dataset.activities['id'].max()) + 1 if len(dataset.activities) else 0
     else:
-        id = selected_activity[0]['id']
+        changed = lambda dataset: dataset.activity(selected_activity[0]['id'])
+        new_id = lambda dataset: selected_activity[0]['id']
+
+    try:
+        dataset = utilities.storage.commit(
+            utilities.datastore.latest(places_store, activities_store),
+            changed,
+            lambda dataset: dataset.upsert_activity(new_id(dataset), entry),
+            lambda dataset: utilities.storage.save_activity(dataset, dataset.saved_id),
+        )
 
-    activities_store[id] = entry
-    
-    # Save to local file
-    activities_df = utilities.activities_dict_to_df(activities_store)
-    activities_df = activities_df.reset_index()[['id', 'label', 'category', 'grade', 'date', 'days', 'context', 'role', 'waypoints', 'participants', 'topo', 'comments']]
-    activities_df.to_json('data_activities.json', orient='table', index=False)
+    except utilities.WriteConflict as conflict:
+        return (
+            False,
+            'Not saved',
+            'red',
+            'This activity was changed by someone else meanwhile, check it and save again.',
+            utilities.datastore.put(conflict.dataset)
+        )
+
+    utilities.figure_cache.expire(activities_store)
 
     return (
         hide_alert,
-        activities_store
+        'Well done!',
+        'green',
+        None,
+        utilities.datastore.put(dataset)
+    )
+
+
+# Data saved by another worker: poll the storage stamp, reload when it changed
+#----------------------------------------------------------------------------
+@app.callback(
+    [Output('places_store',     'data', allow_duplicate=True),
+     Output('activities_store', 'data', allow_duplicate=True)],
+     Input('data_poll',         'n_intervals'),
+    [State('places_store',      'data'),
+     State('activities_store',  'data')],
+    prevent_initial_call=True
+)
+def poll_data(
+    n, places_store, activities_store
+):
+
+    if utilities.datastore.latest(places_store, activities_store).stamp == utilities.storage.stamp():
+        raise PreventUpdate
+
+    # Shared by every tab: one reload and one token per save, whichever worker and tab notices it first
+    version = utilities.datastore.current()
+    if version == places_store == activities_store:
+        raise PreventUpdate
+
+    return (
+        version,
+        version
     )
 
 
-# Update Map & figure when filters are updated
+# Callbacks whose response only depends on their request (store versions included): served from the
+# response cache, with ETags, when deployed. Not the saves, nor what reads the data files (poll_data).
+#----------------------------------------------------------------------------
+CACHEABLE_OUTPUTS = {
+    'summits_total.children',
+    'activities_total.children',
+    'place_map.figure',
+    'places_plot.figure',
+    'activities_plot.figure',
+    'grades_overtime.children',
+    'context_overtime.figure',
+}
+
+
+# Figures precomputed on boot with the default filters, in every language: the page showing each of them
+#----------------------------------------------------------------------------
+WARM_UP_PAGES = {
+    'place_map.figure'        : {'navigation_segments.value': 'map'},
+    'places_plot.figure'      : {'navigation_segments.value': 'stats', 'stats_segments.value': 'stats_places'},
+    'activities_plot.figure'  : {'navigation_segments.value': 'stats', 'stats_segments.value': 'stats_year'},
+    'grades_overtime.children': {'navigation_segments.value': 'stats', 'stats_segments.value': 'stats_grade'},
+    'context_overtime.figure' : {'navigation_segments.value': 'stats', 'stats_segments.value': 'stats_context'},
+}
+
+
+# Lazy evaluation helpers
+#----------------------------------------------------------------------------
+NAVIGATION_INPUTS = {'navigation_segments', 'stats_segments', 'places_plot_switch'}
+
+def render_or_skip(
+    visible: bool,
+    stale  : bool,
+    outputs: int,
+):
+    '''
+    Decide whether a lazily evaluated output has to be built. Returns None when it must be
+    (re)computed, otherwise the values to send back: no_update, and the output flagged as stale.
+    '''
+
+    triggered = {trigger['prop_id'].split('.')[0] for trigger in ctx.triggered}
+    navigation_only = triggered <= NAVIGATION_INPUTS
+
+    if not visible:
+        if navigation_only:
+            raise PreventUpdate
+        return (no_update,) * outputs + (True,)
+
+    # Output shown again, but nothing changed since it was last built
+    if navigation_only and not stale:
+        raise PreventUpdate
+
+    return None
+
+
+def cached_figure(
+    name    : str,
+    versions: tuple,
+    inputs  : tuple,
+    build,
+    rendered: dict,
+):
+    '''
+    Figure from the cache, sent as a partial update of the one the browser holds (known by its digest)
+    when possible. Returns the figure or patch, and the digest of the new figure.
+    '''
+
+    figure = utilities.figure_cache.get_or_build(name, versions, inputs, build)
+    digest = utilities.figure_cache.get_or_build('digest', versions, (name, inputs), lambda: utilities.figure_digest(figure))
+
+    return (
+        utilities.figure_patch(figure, digest, rendered),
+        digest
+    )
+
+
+def zoomed_view(
+    view  : dict,
+    points: int,
+    zoomed: bool,
+):
+    '''
+    View a scatter plot has to be built for: None when all its points are sent anyway, in which
+    case zooming needs no new figure
+    '''
+
+    if points <= utilities.decimation.MAX_POINTS:
+        if zoomed:
+            raise PreventUpdate
+        return None
+
+    # Both axes reset: the whole plot
+    return view if view and any(view.values()) else None
+
+
+def activities_frame(
+    dataset        : utilities.Dataset,
+    language       : str,
+    filter_waypoint: str = None
+) -> pd.DataFrame:
+
+    activities = dataset.activities_for(language)
+
+    if filter_waypoint:
+        activities = activities[activities['id'].isin(dataset.index.activities(filter_waypoint))]
+
+    return activities
+
+
+# Places totals & search list, always displayed
 #----------------------------------------------------------------------------
 @app.callback( 
-    [Output('place_map',                 'figure'  ),
-     Output('places_plot',               'figure'  ),
-     Output('activities_plot',           'figure'  ),
-     Output('summits_total',             'children'),
+    [Output('summits_total',             'children'),
      Output('passes_total',              'children'),
      Output('huts_total',                'children'),
-     Output('activities_tabulator',      'data'    ),
-     Output('grades_overtime',           'children'),
-     Output('context_overtime',          'figure'  ),
-     Output('search_place',              'data'    ),
+     Output('search_place',              'data'    )],
+     Input ('places_store',              'data'    )
+)
+def update_places_totals(
+    places_store
+):
+
+    places = utilities.datastore.get(places_store).places
+
+    if len(places)==0:
+        return (0, 0, 0, [])
+
+    stats_places = places.groupby('category')['category'].count()
+
+    all_places = places['waypoint'].unique()
+    all_places.sort()
+
+    return (
+        stats_places.get('summit', 0),
+        stats_places.get('pass', 0),
+        stats_places.get('hut', 0),
+        all_places
+    )
+
+
+# Activities table, remote mode: the browser asks for one page at a time (see activities_request
+# in clientside.js), for the data version, waypoint filter and language the table shows
+#----------------------------------------------------------------------------
+PAGE_SIZE = 200
+
+def activities_rows(
+    version        : str,
+    language       : str,
+    filter_waypoint: str  = None,
+    filters        : list = (),
+    sorters        : list = (),
+) -> np.ndarray:
+    '''
+    Rows of the table for these filters and sort (see Dataset.activities_query), cached per data version.
+    ValueError when filters or sorters are malformed.
+    '''
+
+    columns = utilities.datastore.get(version).activities_for(language).columns
+    filters, sorters = utilities.table_query(filters, sorters, columns)
+
+    return utilities.figure_cache.get_or_build(
+        'activities_rows',
+        (version,),
+        (language, filter_waypoint, filters, sorters),
+        lambda: utilities.datastore.get(version).activities_query(language, filter_waypoint, filters, sorters)
+    )
+
+
+MAX_PAGE_SIZE = 1000
+
+def activities_page_request(
+    request
+) -> dict:
+    '''
+    Checked body of an activities_page request: ValueError when anything is malformed
+    '''
+
+    if not isinstance(request, dict):
+        raise ValueError('Expected a json object')
+
+    version = utilities.check_version(request.get('version'))
+    language = request.get('language')
+    if language not in utilities.LANGUAGES:
+        raise ValueError(f'Unknown language: {language!r}')
+
+    page = request.get('page') or 1
+    size = request.get('size') or PAGE_SIZE
+    if type(page) is not int or type(size) is not int or page < 1 or not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError(f'page and size must be integers, size up to {MAX_PAGE_SIZE}')
+
+    filter_waypoint = request.get('filter')
+    if filter_waypoint is not None and not isinstance(filter_waypoint, str):
+        raise ValueError('filter must be a waypoint name')
+
+    columns = utilities.datastore.get(version).activities_for(language).columns
+    filters, sorters = utilities.table_query(request.get('filters'), request.get('sorters'), columns)
+
+    return {
+        'version' : version,
+        'language': language,
+        'page'    : page,
+        'size'    : size,
+        'filter'  : filter_waypoint,
+        'filters' : filters,
+        'sorters' : sorters,
+    }
+
+
+@app.server.route(f'{app.config.routes_pathname_prefix}activities_page', methods=['POST'])
+def activities_page():
+
+    try:
+        request = activities_page_request(flask.request.get_json(silent=True))
+    except ValueError as error:
+        flask.abort(400, str(error))
+
+    page, size = request['page'], request['size']
+    rows = activities_rows(request['version'], request['language'], request['filter'], request['filters'], request['sorters'])
+
+    activities = utilities.datastore.get(request['version']).activities_for(request['language'])
+    activities = activities.iloc[rows[(page - 1) * size : page * size]]
+    activities = activities.assign(date=activities['date'].dt.strftime('%Y-%m-%d'))
+
+    return flask.Response(
+        to_json_plotly({'last_page': max(-(-len(rows) // size), 1), 'data': activities.to_dict('records')}),
+        mimetype = 'application/json'
+    )
+
+
+# Shown data version, waypoint filter or language changed: reload the table, clientside
+app.clientside_callback(
+    ClientsideFunction(namespace='mountain_goats', function_name='reload_activities'),
+    Output('activities_tabulator_shown', 'data'    ),
+    [Input('activities_store',           'data'    ),
+     Input('filter_activity_waypoints',  'value'   ),
+     Input('language',                   'children')]
+)
+
+
+# Activities/days totals of the same query as the table
+@app.callback(
+    [Output('activities_total',          'children'     ),
+     Output('days_total',                'children'     )],
+    [Input ('activities_store',          'data'         ),
+     Input ('filter_activity_waypoints', 'value'        ),
+     Input ('language',                  'children'     ),
+     Input ('activities_tabulator',      'dataFiltering')]
+)
+def update_activities_totals(
+    activity_store, filter_waypoint, language, filters
+):
+
+    # Header filters come from the browser: malformed ones leave the totals as they are
+    try:
+        rows = activities_rows(activity_store, language, filter_waypoint, filters)
+    except ValueError:
+        raise PreventUpdate
+
+    days = utilities.datastore.get(activity_store).activities_for(language)['days'].to_numpy()[rows]
+
+    return (
+        len(rows),
+        int(np.ceil(np.nansum(days)))
+    )
+
+
+# Update Map when filters are updated, only if the map is displayed.
+# Only places inside the viewport (plus a margin) are sent, clustered below CLUSTER_MAX_ZOOM:
+# panning/zooming outside of it, or to another clustering level, re-renders.
+#----------------------------------------------------------------------------
+@app.callback( 
+    [Output('place_map',                 'figure'      ),
+     Output('place_map_viewport',        'data'        ),
+     Output('place_map_stale',           'data'        )],
+    [Input ('altitude_slider',           'value'       ),
+     Input ('category_selection',        'value'       ),
+     Input ('search_place',              'value'       ),
+     Input ('places_store',              'data'        ),
+     Input ('language',                  'children'    ),
+     Input ('navigation_segments',       'value'       ),
+     Input ('place_map',                 'relayoutData')],
+    [State ('altitude_slider',           'min'         ),
+     State ('altitude_slider',           'max'         ),
+     State ('place_map_viewport',        'data'        ),
+     State ('place_map_stale',           'data'        )]
+)
+def update_map(
+    altitude_values, categories, search_place, places_store, language, layout, relayout,
+    min_alt, max_alt, rendered, stale
+):
+
+    view = utilities.spatial.relayout_view(relayout)
+
+    # Pan/zoom: nothing to do while the view stays within the places already sent, at the same level
+    if {trigger['prop_id'] for trigger in ctx.triggered} == {'place_map.relayoutData'}:
+        if search_place or view is None:
+            raise PreventUpdate
+        if rendered and rendered['level'] == utilities.spatial.cluster_level(view[1]) and utilities.spatial.contains(rendered['bounds'], view[0]):
+            raise PreventUpdate
+
+    skip = render_or_skip(layout in ('map', None), stale, 2)
+    if skip:
+        return skip
+
+    dataset = utilities.datastore.get(places_store)
+
+    if len(dataset.places)==0:
+        return (None, None, False)
+
+    places = dataset.places_for(language)
+
+    # User searched for a place: the map focuses on it, no culling
+    if search_place:
+        map_figure = utilities.figure_cache.get_or_build(
+            'create_map',
+            (places_store,),
+            (language, [search_place]),
+            lambda: utilities.create_map(places, language, [search_place], 800, uirevision=search_place)
+        )
+        return (map_figure, None, False)
+
+    # Filters answered by the index
+    altitude = None
+    if altitude_values and altitude_values != [min_alt, max_alt]:
+        altitude = altitude_values
+
+    index = dataset.place_index()
+    rows = index.select(categories or None, altitude)
+
+    if view:
+        center = relayout['mapbox.center']
+        zoom = view[1]
+        bounds = view[0]
+    else:
+        selected = places.iloc[rows]
+        center = {'lat': selected['latitude'].mean(), 'lon': selected['longitude'].mean()} if len(selected) else None
+        zoom = 8
+        bounds = utilities.spatial.view_bounds(center, zoom) if center else None
+
+    padded = utilities.spatial.padded_bounds(bounds) if bounds else None
+    level = utilities.spatial.cluster_level(zoom)
+
+    def build():
+
+        if level < utilities.spatial.CLUSTER_MAX_ZOOM:
+            frame = index.clusters(level, categories or None, altitude, padded)
+            frame['category_translated'] = frame['category'].map(utilities.settings.translation_map('places', language))
+        else:
+            frame = places.iloc[np.intersect1d(rows, index.within(padded)) if padded else rows]
+
+        return utilities.create_map(
+            frame,
+            language,
+            height     = 800,
+            zoom       = zoom,
+            center     = center,
+            uirevision = 'place_map',
+            clustered  = level < utilities.spatial.CLUSTER_MAX_ZOOM,
+        )
+
+    map_figure = utilities.figure_cache.get_or_build(
+        'create_map',
+        (places_store,),
+        (language, altitude, sorted(categories or []), padded, center, zoom),
+        build
+    )
+
+    return (
+        map_figure,
+        {'bounds': padded, 'level': level},
+        False
+    )
+
+
+# Places plot or trivia, only the one selected with the switch.
+# Scatter plots with more points than MAX_POINTS are decimated: zooming in sends the points of that view.
+#----------------------------------------------------------------------------
+@app.callback( 
+    [Output('places_plot',               'figure'  ),
      Output('places_trivia_tabulator',   'data'    ),
      Output('places_plot_div',           'style'   ),
-     Output('places_trivia_div',         'style'   )],
-    [Input ('altitude_slider',           'value'   ),
-     Input ('category_selection',        'value'   ),
-     Input ('search_place',              'value'   ),
+     Output('places_trivia_div',         'style'   ),
+     Output('places_plot_digest',        'data'    ),
+     Output('places_plot_view',          'data'    ),
+     Output('places_plot_stale',         'data'    )],
+    [Input ('category_selection',        'value'   ),
      Input ('places_plot_switch',        'value'   ),
-     Input ('cumulative_activities',     'checked' ),
      Input ('places_store',              'data'    ),
      Input ('activities_store',          'data'    ),
      Input ('filter_activity_waypoints', 'value'   ),
-     Input ('language',                  'children')],
+     Input ('language',                  'children'),
+     Input ('navigation_segments',       'value'   ),
+     Input ('stats_segments',            'value'   ),
+     Input ('places_plot',               'relayoutData')],
     [State ('altitude_slider',           'min'     ),
-     State ('altitude_slider',           'max'     )]
+     State ('altitude_slider',           'max'     ),
+     State ('places_plot_digest',        'data'    ),
+     State ('places_plot_view',          'data'    ),
+     State ('places_plot_stale',         'data'    )]
 )
-def update_all(
-    altitude_values, categories, search_place, places_plot_switch, cumulative_activities, places_store, activity_store, filter_waypoint, language,
-    min_alt, max_alt
+def update_places_plot(
+    categories, places_plot_switch, places_store, activity_store, filter_waypoint, language, layout, stat, relayout,
+    min_alt, max_alt, rendered, shown_view, stale
 ):
 
+    # Zoom kept while filters change, until the other plot is shown
+    view = shown_view['view'] if shown_view and shown_view['switch'] == places_plot_switch else None
+    zoomed = {trigger['prop_id'] for trigger in ctx.triggered} == {'places_plot.relayoutData'}
+
+    if zoomed:
+        view = utilities.decimation.relayout_view(relayout, view)
+        if view is None or places_plot_switch not in ('curve', 'exploded_view'):
+            raise PreventUpdate
+
+    skip = render_or_skip(layout=='stats' and stat in ('stats_places', None), stale, 6)
+    if skip:
+        return skip
+
     places_trivia_tabulator = []
     places_figure = None
-    activities_figure = None
-    grades_overtime_layout=  None
-    context_overtime = None
+    places_digest = None
     places_plot_div   = {'display': 'none'}
     places_trivia_div = {'display': 'none'}
 
-    if len(places_store)==0 or len(activity_store)==0:
-        return (None, None, None, 0, 0, 0, [], None, None, [])
-
-    places = utilities.places_dict_to_df(places_store)
-    stats_places = places.groupby('category')['category'].count()
-
-    activities = utilities.activities_dict_to_df(activity_store).sort_values(by='date', ascending=False)
-    
-    # Translate categorical variables
-    categories_map = utilities.translation['activities']
-    categories_map = {key: categories_map[key][language] for key in categories_map }
-    activities['category_translated'] = activities['category'].map(categories_map)
-    context_map = utilities.translation['contexts']
-    context_map = {key: context_map[key][language] for key in context_map }
-    activities['context_translated'] = activities['context'].map(context_map)
-    role_map = utilities.translation['roles']
-    role_map = {key: role_map[key][language] for key in role_map }
-    activities['role_translated'] = activities['role'].map(role_map)
-
-    category_map = utilities.translation['places']
-    category_map = {key: category_map[key][language] for key in category_map }
-    places['category_translated'] = places['category'].map(category_map)
-
-    if filter_waypoint:
-        activities = activities[activities['waypoints'].str.contains(filter_waypoint, regex=False, na=False)]
+    places = utilities.datastore.get(places_store).places_for(language)
+    dataset = utilities.datastore.get(activity_store)
 
+    if len(places)==0 or len(dataset.activities)==0:
+        return (None, [], places_plot_div, places_trivia_div, None, None, False)
 
     if places_plot_switch == 'trivia':
         
         places_trivia_div = {}
+        activities = activities_frame(dataset, language, filter_waypoint)
     
         # Trivia
         places = places[places['category'].isin(['pass', 'hut', 'summit'])]
 
-        min_alt = places.loc[places.groupby('category_translated').altitude.idxmin()]
-        min_alt['lowest'] = min_alt['waypoint'] + ' (' + min_alt['altitude'].astype(str) + ' m)'
-        min_alt = min_alt[['category_translated', 'lowest']]
+        lowest = places.loc[places.groupby('category_translated', observed=True).altitude.idxmin()]
+        lowest['lowest'] = lowest['waypoint'] + ' (' + lowest['altitude'].astype(str) + ' m)'
+        lowest = lowest[['category_translated', 'lowest']]
 
-        max_alt = places.loc[places.groupby('category_translated').altitude.idxmax()]
-        max_alt['highest'] = max_alt['waypoint'] + ' (' + max_alt['altitude'].astype(str)  + ' m)'
-        max_alt = max_alt[['category_translated', 'highest']]
+        highest = places.loc[places.groupby('category_translated', observed=True).altitude.idxmax()]
+        highest['highest'] = highest['waypoint'] + ' (' + highest['altitude'].astype(str)  + ' m)'
+        highest = highest[['category_translated', 'highest']]
   
-        waypoints = activities['waypoints']
-        most_visited = []
-        for waypoint in waypoints:
-            if waypoint:
-                for w in waypoint.split(', '):
-                    most_visited.append(w)
-        
-        most_visited = pd.DataFrame(most_visited, columns=['waypoint'])
-        most_visited = most_visited.merge(places[['waypoint', 'category']], on='waypoint', how='left')
-        
-        category_map = utilities.translation['places']
-        category_map = {key: category_map[key][language] for key in category_map }
-        most_visited['category_translated'] = most_visited['category'].map(category_map)
-        
-        most_visited = most_visited.groupby(['category_translated', 'waypoint']).count().reset_index()
-        most_visited = most_visited.loc[most_visited.groupby('category_translated').category.idxmax()]
-        most_visited['most_visited'] = most_visited['waypoint'] + ' (' + most_visited['category'].astype(str) + ')'
+        # Visits from the waypoint index, among the filtered activities only
+        visits = dataset.index.visits(activities['id'] if filter_waypoint else None)
+        most_visited = visits.rename('visits').rename_axis('waypoint').reset_index()
+        most_visited = most_visited.merge(places[['waypoint', 'category_translated']], on='waypoint')
+
+        most_visited = most_visited.loc[most_visited.groupby('category_translated').visits.idxmax()]
+        most_visited['most_visited'] = most_visited['waypoint'] + ' (' + most_visited['visits'].astype(str) + ')'
+        most_visited = most_visited[['category_translated', 'most_visited']]
 
         places_trivia_tabulator = reduce(
-            lambda  left,right: pd.merge(left,right,on=['category_translated'], how='outer'), [min_alt, max_alt, most_visited]
+            lambda  left,right: pd.merge(left,right,on=['category_translated'], how='outer'), [lowest, highest, most_visited]
         )
         places_trivia_tabulator = places_trivia_tabulator.to_dict('records')
 
     else: 
 
-        places_plot_div   = {}    
+        places_plot_div = {}    
+
+        # Places plot: only build the figure selected with the switch
+        if places_plot_switch == 'curve':
+            places = utilities.datastore.get(places_store).places_by_altitude(language)
+            view = zoomed_view(view, len(places), zoomed)
+            places_figure, places_digest = cached_figure(
+                'waypoints_by_altitude',
+                (places_store,),
+                (language, (min_alt, max_alt), sorted(categories or []), view),
+                lambda: utilities.waypoints_by_altitude(places, (min_alt, max_alt), categories, language, view),
+                rendered
+            )
+        elif places_plot_switch == 'year_summary':
+            places_figure, places_digest = cached_figure(
+                'places_yearly_summary',
+                (places_store, activity_store),
+                (language, filter_waypoint),
+                lambda: utilities.places_yearly_summary(utilities.datastore.latest(places_store, activity_store).aggregates(filter_waypoint).waypoints_for(language), language),
+                rendered
+            )
+        else:
+            waypoints_overtime = utilities.datastore.latest(places_store, activity_store).waypoints_overtime(language, filter_waypoint)
+            view = zoomed_view(view, len(waypoints_overtime), zoomed)
+            places_figure, places_digest = cached_figure(
+                'waypoints_by_year',
+                (places_store, activity_store),
+                (language, filter_waypoint, (min_alt, max_alt), sorted(categories or []), view),
+                lambda: utilities.waypoints_by_year(waypoints_overtime, (min_alt, max_alt), categories, language, view=view),
+                rendered
+            )
 
-        # Places plot
-        places_figures = {
-            'curve'        : utilities.waypoints_by_altitude(places, (min_alt, max_alt), categories, language),
-            'exploded_view': utilities.waypoints_by_year(places, activities, (min_alt, max_alt), categories, language),
-            'year_summary' : utilities.places_yearly_summary(places, activities, language)
-        }
+    return (
+        places_figure,
+        places_trivia_tabulator,
+        places_plot_div,
+        places_trivia_div,
+        places_digest,
+        {'switch': places_plot_switch, 'view': view} if view else None,
+        False
+    )
 
-        places_figure = places_figures[places_plot_switch]
 
-        # Activities plot
-        activities_figure = utilities.activities_yearly_summary(activities, cumulative_activities, language)
+# Activities plot
+#----------------------------------------------------------------------------
+@app.callback( 
+    [Output('activities_plot',           'figure'  ),
+     Output('activities_plot_digest',    'data'    ),
+     Output('activities_plot_stale',     'data'    )],
+    [Input ('cumulative_activities',     'checked' ),
+     Input ('activities_store',          'data'    ),
+     Input ('filter_activity_waypoints', 'value'   ),
+     Input ('language',                  'children'),
+     Input ('navigation_segments',       'value'   ),
+     Input ('stats_segments',            'value'   )],
+    [State ('activities_plot_digest',    'data'    ),
+     State ('activities_plot_stale',     'data'    )]
+)
+def update_activities_plot(
+    cumulative_activities, activity_store, filter_waypoint, language, layout, stat,
+    rendered, stale
+):
+
+    skip = render_or_skip(layout=='stats' and stat=='stats_year', stale, 2)
+    if skip:
+        return skip
 
-        # Grades plot
-        grades_overtime = utilities.grades_overtime(activities, language)
-        grades_overtime_layout = html.Div(
-            dbc.Row(
-                [
-                    dbc.Col([
-                        dcc.Graph(figure=grades_overtime[key])
-                    ], width=6)
-                for key in grades_overtime]
-            )
-        )
+    dataset = utilities.datastore.get(activity_store)
 
-        # Contexts plot
-        context_overtime = utilities.contexts_yearly_summary(activities, language)      
-   
+    if len(dataset.activities)==0:
+        return (None, None, False)
 
-    # Main map
-    if search_place:
-        search_place = [search_place]
+    activities_figure, activities_digest = cached_figure(
+        'activities_yearly_summary',
+        (activity_store,),
+        (language, filter_waypoint, cumulative_activities),
+        lambda: utilities.activities_yearly_summary(dataset.aggregates(filter_waypoint).days_for(language), cumulative_activities, language),
+        rendered
+    )
 
-    map_figure = utilities.create_map(
-        places,
-        language,
-        search_place, 
-        800,
-        altitude_values,
-        (min_alt, max_alt), 
-        categories,
+    return (
+        activities_figure,
+        activities_digest,
+        False
     )
 
-    all_places = places['waypoint'].unique()
-    all_places.sort()
+
+# Grades plot
+#----------------------------------------------------------------------------
+@app.callback( 
+    [Output('grades_overtime',           'children'),
+     Output('grades_overtime_stale',     'data'    )],
+    [Input ('activities_store',          'data'    ),
+     Input ('filter_activity_waypoints', 'value'   ),
+     Input ('language',                  'children'),
+     Input ('navigation_segments',       'value'   ),
+     Input ('stats_segments',            'value'   )],
+     State ('grades_overtime_stale',     'data'    )
+)
+def update_grades_overtime(
+    activity_store, filter_waypoint, language, layout, stat,
+    stale
+):
+
+    skip = render_or_skip(layout=='stats' and stat=='stats_grade', stale, 1)
+    if skip:
+        return skip
+
+    dataset = utilities.datastore.get(activity_store)
+
+    if len(dataset.activities)==0:
+        return (None, False)
+
+    grades_overtime = utilities.figure_cache.get_or_build(
+        'grades_overtime',
+        (activity_store,),
+        (language, filter_waypoint),
+        lambda: utilities.grades_overtime(activities_frame(dataset, language, filter_waypoint), language)
+    )
+    grades_overtime_layout = html.Div(
+        dbc.Row(
+            [
+                dbc.Col([
+                    dcc.Graph(figure=grades_overtime[key])
+                ], width=6)
+            for key in grades_overtime]
+        )
+    )
 
     return (
-        map_figure,
-        places_figure,
-        activities_figure,
-        stats_places['summit'],
-        stats_places['pass'],
-        stats_places['hut'],
-        activities.to_dict('records'),
         grades_overtime_layout,
-        context_overtime, 
-        all_places,
-        places_trivia_tabulator,
-        places_plot_div,
-        places_trivia_div
+        False
+    )
+
+
+# Contexts plot
+#----------------------------------------------------------------------------
+@app.callback( 
+    [Output('context_overtime',          'figure'  ),
+     Output('context_overtime_digest',   'data'    ),
+     Output('context_overtime_stale',    'data'    )],
+    [Input ('activities_store',          'data'    ),
+     Input ('filter_activity_waypoints', 'value'   ),
+     Input ('language',                  'children'),
+     Input ('navigation_segments',       'value'   ),
+     Input ('stats_segments',            'value'   )],
+    [State ('context_overtime_digest',   'data'    ),
+     State ('context_overtime_stale',    'data'    )]
+)
+def update_context_overtime(
+    activity_store, filter_waypoint, language, layout, stat,
+    rendered, stale
+):
+
+    skip = render_or_skip(layout=='stats' and stat=='stats_context', stale, 2)
+    if skip:
+        return skip
+
+    dataset = utilities.datastore.get(activity_store)
+
+    if len(dataset.activities)==0:
+        return (None, None, False)
+
+    context_figure, context_digest = cached_figure(
+        'contexts_yearly_summary',
+        (activity_store,),
+        (language, filter_waypoint),
+        lambda: utilities.contexts_yearly_summary(dataset.aggregates(filter_waypoint).contexts_for(language), language),
+        rendered
+    )
+
+    return (
+        context_figure,
+        context_digest,
+        False
     )
 
 #----------------------------------------------------------------------------
@@ -625,44 +1131,23 @@ def update_all(
 
 
 
-# Display how many activities/days were selected
+# Display filters, clientside
 #----------------------------------------------------------------------------
-@app.callback(
-    [Output('activities_total',    'children'    ),
-     Output('days_total',          'children'    )],
-     Input('activities_tabulator', 'dataFiltered')
-)
-def filter_activities(rows):
-
-    n = sum([1 for row in rows['rows'] if row != None])    
-    days = sum([row['days'] for row in rows['rows'] if row != None])    
-
-    return (
-        n,
-        math.ceil(days)
-    )
-
-
-# Display filters
-#----------------------------------------------------------------------------
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='mountain_goats', function_name='toggle'),
     Output('collapse_map_filter',  'is_open' ),
     Input ('filter_map',           'n_clicks'),
     State ('collapse_map_filter',  'is_open' ),
     prevent_initial_call=True
 )
-def collapse_map_filter(n, is_open):
-    return not(is_open)
-
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='mountain_goats', function_name='toggle'),
     Output('collapse_activities_filter', 'is_open' ),
     Input ('filter_activities',          'n_clicks'),
     State ('collapse_activities_filter', 'is_open' ),
     prevent_initial_call=True
 )
-def collapse_activities_filter(n, is_open):
-    return not(is_open)
 
 
 # Switch language
@@ -7,7 +7,6 @@ from datetime import datetime
 import utilities
 from app_init import app
 import pandas as pd
-import yaml
 
 
 # Dash layouts
@@ -17,7 +16,7 @@ def map_segment(
     local : bool
 ) -> html:
 
-    highest_altitude = places['altitude'].max()
+    highest_altitude = int(places['altitude'].max()) if len(places) else 0
     highest_altitude -= highest_altitude % -1000
     altitude_steps = list(set(list(range(0, highest_altitude, 1000)) + [highest_altitude]))
     altitude_steps.sort()
@@ -170,7 +169,8 @@ def activities_segment(
     places    : pd.DataFrame,
     metadata  : dict,
     local     : bool,
-    language  : str
+    language  : str,
+    version   : str
 ) -> html:
 
     waypoints = places['waypoint'].unique()
@@ -227,7 +227,17 @@ def activities_segment(
                 dash_tabulator.DashTabulator(
                     id      = 'activities_tabulator',
                     theme   = 'tabulator_simple',
-                    options = {'pagination': 'local', 'paginationSize': 200, 'height': 630, 'selectable': 1},
+                    options = {
+                        'pagination'     : 'remote',
+                        'paginationSize' : 200,
+                        'ajaxURL'        : app.get_relative_path('/activities_page'),
+                        'ajaxParams'     : {'version': version, 'filter': None, 'language': language},
+                        'ajaxRequestFunc': {'variable': 'dash_clientside.mountain_goats.activities_request'},
+                        'ajaxSorting'    : True,
+                        'ajaxFiltering'  : True,
+                        'height'         : 630,
+                        'selectable'     : 1
+                    },
                 ),
             ], id='activity_table', width = 12),
             
@@ -518,29 +528,43 @@ def main_layout(
     local,
     language = 'fr'
 ) -> html:
+    '''
+    Layout served on each page load, for the current data: files are only read again when the
+    storage changed, and the layout of a data version is built once
+    '''
 
-    with open('settings/metadata.yaml') as file:
-        metadata = yaml.load(file, Loader=yaml.FullLoader)
+    version = utilities.datastore.current()
 
-    # Load visited places and activities
-    places, activities = utilities.load_data(metadata)
+    return utilities.figure_cache.get_or_build(
+        'main_layout',
+        (version,),
+        (local, language),
+        lambda: build_layout(utilities.datastore.get(version), local, language)
+    )
 
-    places_df = utilities.places_dict_to_df(places)
 
-    activities_df = utilities.places_dict_to_df(activities)
-    activities_no_waypoints = activities_df[activities_df['waypoints'].isnull()]
-    #print(activities_no_waypoints[['label', 'date']].to_string())
+def build_layout(
+    dataset : utilities.Dataset,
+    local,
+    language = 'fr'
+) -> html:
+
+    metadata = dataset.metadata
+    version = dataset.version
+
+    places_df = dataset.places
 
     layout = html.Div([
         
+        # Only the data version goes to the browser, callbacks resolve it server-side
         dcc.Store(
             id   = 'places_store',
-            data = places
+            data = version
         ),
 
         dcc.Store(
             id   = 'activities_store',
-            data = activities
+            data = version
         ),
 
         dcc.Store(
@@ -548,6 +572,28 @@ def main_layout(
             data = metadata
         ),
 
+        # Outputs only built when displayed: flag raised when their inputs changed while hidden
+        dcc.Store(id='place_map_stale',        data=True),
+        dcc.Store(id='places_plot_stale',      data=True),
+        dcc.Store(id='activities_plot_stale',  data=True),
+        dcc.Store(id='grades_overtime_stale',  data=True),
+        dcc.Store(id='context_overtime_stale', data=True),
+
+        # Saves made by other workers are picked up within that delay
+        dcc.Interval(id='data_poll', interval=30*1000),
+
+        # What the browser holds (version and filters of the table, figure digests), so that saves send partial updates
+        dcc.Store(id='activities_tabulator_shown'),
+        dcc.Store(id='places_plot_digest'),
+        dcc.Store(id='activities_plot_digest'),
+        dcc.Store(id='context_overtime_digest'),
+
+        # Padded bounds of the places sent with the map, panning inside them needs no new figure
+        dcc.Store(id='place_map_viewport'),
+
+        # Axis ranges the places plot is zoomed in, with the switch they apply to: only those points are sent
+        dcc.Store(id='places_plot_view'),
+
         html.Div(
             language,
             id    = 'language',
@@ -640,7 +686,7 @@ def main_layout(
                                     children = map_segment(places_df, local)),
                                 html.Div(
                                     id       = 'activities_content', 
-                                    children = activities_segment(places_df, metadata, local, language),
+                                    children = activities_segment(places_df, metadata, local, language, version),
                                     style    = {'display':'none'}),
                                 html.Div(
                                     id       = 'stats_content',
@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import utilities
+from benchmarks.generate import generate
+
+
+# Settings stay in the repository, data goes to temporary directories
+utilities.settings.directory = os.path.join(ROOT, 'settings')
+
+
+@pytest.fixture
+def data_directory(tmp_path, monkeypatch):
+    '''
+    Generated data files (200 activities) in a temporary working directory
+    '''
+
+    generate(200, directory=str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    return tmp_path
+
+
+@pytest.fixture
+def metadata():
+    return utilities.settings.metadata
+
+
+@pytest.fixture
+def place():
+    return {'waypoint': 'Test summit', 'latitude': 45.9, 'longitude': 6.9, 'altitude': 3210, 'category': 'summit'}
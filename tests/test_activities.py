@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from dash.exceptions import PreventUpdate
+import utilities
+
+
+@pytest.fixture
+def dataset(data_directory, metadata):
+    return utilities.storage.load(metadata)
+
+
+def expected(activities, selected, by='date', ascending=False):
+    '''
+    Positions of the selected rows, sorted the slow way
+    '''
+
+    return activities[selected].sort_values(by=by, ascending=ascending, kind='stable').index.to_numpy()
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_default_order_is_latest_first(dataset):
+
+    activities = dataset.activities_for('en')
+    rows = dataset.activities_query('en')
+
+    assert len(rows) == len(activities)
+    assert activities['date'].iloc[rows].is_monotonic_decreasing
+
+
+def test_waypoint_filter(dataset):
+
+    activities = dataset.activities_for('en')
+    waypoint = dataset.waypoints['waypoint'].value_counts().index[0]
+    visits = activities['waypoints'].fillna('').str.split(', ').apply(lambda waypoints: waypoint in waypoints)
+
+    rows = dataset.activities_query('en', waypoint)
+
+    assert len(rows) and sorted(rows) == sorted(np.flatnonzero(visits.to_numpy()))
+
+
+def test_header_filters_and_sorters(dataset):
+
+    activities = dataset.activities_for('en').reset_index(drop=True)
+    category = activities['category'].astype(str).iloc[0]
+    filters = [
+        {'field': 'category', 'type': '=',    'value': category},
+        {'field': 'label',    'type': 'like', 'value': ''},
+    ]
+    sorters = [{'field': 'days', 'dir': 'asc'}]
+
+    rows = dataset.activities_query('en', None, filters, sorters)
+    selected = activities['category'].astype(str) == category
+
+    assert list(rows) == list(expected(activities, selected, 'days', True))
+
+    rows = dataset.activities_query('en', None, [{'field': 'date', 'type': 'starts', 'value': '20'}])
+    assert len(rows) == len(activities)
+
+
+@pytest.mark.parametrize('filters, sorters', [
+    ('category', []),
+    ([{'field': 'category', 'type': '<', 'value': 'x'}], []),
+    ([{'field': 'unknown', 'type': '=', 'value': 'x'}], []),
+    ([{'field': ['category'], 'type': '=', 'value': 'x'}], []),
+    ([{'field': 'category', 'type': '=', 'value': ['x']}], []),
+    ([], [{'field': 'date', 'dir': 'up'}]),
+    ([], [{'field': 'unknown', 'dir': 'asc'}]),
+])
+def test_malformed_queries(dataset, filters, sorters):
+
+    with pytest.raises(ValueError):
+        dataset.activities_query('en', None, filters, sorters)
+
+
+#------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def client(data_directory):
+
+    import dash_callbacks
+
+    # The layout (app.py) is not needed by the route, Dash only checks there is one
+    if dash_callbacks.app.layout is None:
+        dash_callbacks.app.layout = dash_callbacks.html.Div()
+
+    return dash_callbacks.app.server.test_client()
+
+
+def test_activities_page(client):
+
+    version = utilities.datastore.current()
+    response = client.post('/activities_page', json={'version': version, 'language': 'en', 'page': 1, 'size': 10})
+
+    assert response.status_code == 200
+    assert len(response.get_json()['data']) == 10
+
+
+@pytest.mark.parametrize('request_body', [
+    None,
+    [],
+    {'version': '../../etc', 'language': 'en'},
+    {'language': 'xx'},
+    {'language': 'en', 'size': 10 ** 6},
+    {'language': 'en', 'page': '1'},
+    {'language': 'en', 'filter': {'waypoint': 1}},
+    {'language': 'en', 'filters': [{'field': 'category', 'type': 'regex', 'value': '.*'}]},
+    {'language': 'en', 'sorters': [{'field': '__class__', 'dir': 'asc'}]},
+])
+def test_activities_page_refuses_malformed_requests(client, request_body):
+
+    if isinstance(request_body, dict):
+        request_body = dict({'version': utilities.datastore.current()}, **request_body)
+
+    assert client.post('/activities_page', json=request_body).status_code == 400
+
+
+def test_malformed_header_filters_leave_the_totals(client):
+
+    import dash_callbacks
+
+    version = utilities.datastore.current()
+    activities, days = dash_callbacks.update_activities_totals(version, None, 'en', [])
+
+    assert activities == len(utilities.datastore.get(version).activities)
+
+    with pytest.raises(PreventUpdate):
+        dash_callbacks.update_activities_totals(version, None, 'en', [{'field': 'category', 'type': 'in', 'value': 'x'}])
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+import utilities
+
+
+@pytest.fixture
+def dataset(data_directory, metadata):
+    '''
+    Loaded data, with its aggregates computed: saves update them from then on
+    '''
+
+    dataset = utilities.storage.load(metadata)
+    dataset.aggregates()
+
+    return dataset
+
+
+def assert_recomputed(dataset):
+    '''
+    Aggregates kept up to date equal those computed from scratch
+    '''
+
+    assert 'aggregates' in dataset.derived
+
+    def normalized(series):
+        return series[series != 0].sort_index().astype(float)
+
+    incremental = dataset.aggregates()
+    full = utilities.YearlyAggregates.from_frames(dataset.places, dataset.activities, dataset.waypoints)
+
+    for name in ['days', 'contexts', 'waypoints']:
+        pd.testing.assert_series_equal(normalized(getattr(incremental, name)), normalized(getattr(full, name)), check_names=False)
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_edited_activity(dataset):
+
+    id = int(dataset.activities['id'].iloc[0])
+    other = dataset.activities[dataset.activities['category'] != dataset.activities['category'].iloc[0]].iloc[0]
+    entry = dict(
+        dataset.activity(id),
+        category  = other['category'],
+        context   = other['context'],
+        date      = '1999-07-14',
+        days      = 3,
+        waypoints = other['waypoints'],
+    )
+
+    assert_recomputed(dataset.upsert_activity(id, entry))
+
+
+def test_new_activity(dataset):
+
+    id = int(dataset.activities['id'].max()) + 1
+    entry = dict(dataset.activity(int(dataset.activities['id'].iloc[-1])), date='2031-01-01', days=1.5)
+
+    assert_recomputed(dataset.upsert_activity(id, entry))
+
+
+def test_place_added_after_the_activities_visiting_it(dataset, place):
+
+    id = int(dataset.activities['id'].max()) + 1
+    entry = dict(dataset.activity(int(dataset.activities['id'].iloc[0])), waypoints=place['waypoint'])
+
+    dataset = dataset.upsert_activity(id, entry)
+    assert_recomputed(dataset)
+
+    dataset = dataset.add_place(place)
+    assert dataset.aggregates().waypoints.sum() == dataset.visits()['waypoint'].count()
+    assert_recomputed(dataset)
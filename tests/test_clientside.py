@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import subprocess
+import pytest
+
+
+CLIENTSIDE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'clientside.js')
+NODE = shutil.which('node')
+
+pytestmark = pytest.mark.skipif(NODE is None, reason='node is needed to run assets/clientside.js')
+
+
+# Python reference: the server-side callbacks the clientside ones replace
+#------------------------------------------------------------------------------------------------------------
+def switch_layout(layout):
+
+    layout_map        = {'display': 'none'}
+    layout_activities = {'display': 'none'}
+    layout_stats      = {'display': 'none'}
+
+    if layout=='map' or layout==None:
+        layout_map={}
+    elif layout=='activities':
+        layout_activities = {}
+    elif layout=='stats':
+        layout_stats = {}
+
+    return [layout_map, layout_activities, layout_stats]
+
+
+def switch_stats(stat):
+
+    layout_places  = {'display': 'none'}
+    layout_year    = {'display': 'none'}
+    layout_grade   = {'display': 'none'}
+    layout_context = {'display': 'none'}
+
+    if stat in ('stats_places', None):
+        layout_places={}
+    elif stat=='stats_year':
+        layout_year = {}
+    elif stat=='stats_grade':
+        layout_grade = {}
+    elif stat=='stats_context':
+        layout_context = {}
+
+    return [layout_places, layout_year, layout_grade, layout_context]
+
+
+def toggle(n, is_open):
+    return not(is_open)
+
+
+#------------------------------------------------------------------------------------------------------------
+def clientside(calls: list) -> list:
+    '''
+    Results of the clientside functions, run by node: calls are [function name, arguments]
+    '''
+
+    with open(CLIENTSIDE) as file:
+        script = file.read()
+
+    script = (
+        'var window = {};\n' + script + '\n' +
+        f'var calls = {json.dumps(calls)};\n' +
+        'console.log(JSON.stringify(calls.map(function(call) {\n' +
+        '    return window.dash_clientside.mountain_goats[call[0]].apply(null, call[1]);\n' +
+        '})));\n'
+    )
+
+    result = subprocess.run([NODE, '-'], input=script, capture_output=True, text=True, check=True)
+
+    return json.loads(result.stdout)
+
+
+CASES = (
+    [('switch_layout', switch_layout, [layout]) for layout in ['map', 'activities', 'stats', None, 'unknown']] +
+    [('switch_stats', switch_stats, [stat]) for stat in ['stats_places', 'stats_year', 'stats_grade', 'stats_context', None, 'unknown']] +
+    [('toggle', toggle, [n, is_open]) for n in [None, 1, 2] for is_open in [True, False, None]]
+)
+
+
+def test_clientside_matches_python():
+
+    results = clientside([[name, arguments] for name, _, arguments in CASES])
+
+    for (name, reference, arguments), result in zip(CASES, results):
+        assert result == reference(*arguments), (name, arguments)
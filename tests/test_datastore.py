@@ -0,0 +1,65 @@
+import os
+import pytest
+import utilities
+
+
+#------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('version', ['../../pwned', '', None, 5, ['0' * 16], '0' * 16 + '-' + '0' * 8 + '/x', 'G' * 16 + '-' + '0' * 8])
+def test_invalid_versions(version, tmp_path):
+
+    with pytest.raises(utilities.InvalidVersion):
+        utilities.check_version(version)
+
+    with pytest.raises(utilities.InvalidVersion):
+        utilities.DataStore(utilities.MemoryBackend()).get(version)
+
+    with pytest.raises(utilities.InvalidVersion):
+        utilities.DiskBackend(str(tmp_path)).path(version)
+
+
+def test_put_makes_valid_versions(data_directory, metadata):
+
+    datastore = utilities.DataStore(utilities.MemoryBackend())
+    version = datastore.put(utilities.Dataset.empty(metadata))
+
+    assert utilities.check_version(version) == version
+    assert datastore.get(version).version == version
+
+
+def test_unknown_version_gets_current_data(data_directory, metadata, tmp_path):
+
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return utilities.storage.load(metadata)
+
+    backend = utilities.DiskBackend(str(tmp_path / 'cache'))
+    datastore = utilities.DataStore(backend, loader)
+    current = datastore.current()
+
+    unknown = '0' * 16 + '-' + '0' * 8
+    assert datastore.get(unknown).version == current
+    assert datastore.get(unknown).version == current
+    assert len(loads) == 1
+
+    # Nothing stored for the token sent by the browser
+    if backend.writer:
+        backend.writer.join()
+    assert not os.path.exists(backend.path(unknown))
+    assert os.listdir(tmp_path / 'cache') == [current + '.pkl']
+
+
+def test_disk_backend_shares_datasets(data_directory, metadata, tmp_path):
+
+    dataset = utilities.storage.load(metadata)
+    dataset.place_index()
+
+    backend = utilities.DiskBackend(str(tmp_path))
+    version = utilities.DataStore(backend).put(dataset)
+    assert backend.get(version) is dataset
+
+    backend.writer.join()
+    shared = utilities.DiskBackend(str(tmp_path)).get(version)
+    assert shared is not dataset and shared.derived == {}
+    assert shared.places.equals(dataset.places)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+import utilities
+from utilities.decimation import MAX_POINTS, WEBGL_POINTS, decimate, scatter
+
+
+def frame(rows: int) -> pd.DataFrame:
+    '''
+    Random points in three groups, dates on x
+    '''
+
+    random = np.random.default_rng(0)
+
+    return pd.DataFrame({
+        'date'               : pd.Timestamp('2000-01-01') + pd.to_timedelta(random.integers(0, 9000, rows), unit='D'),
+        'altitude'           : random.normal(2500, 800, rows),
+        'category_translated': random.choice(['summit', 'pass', 'hut'], rows),
+    })
+
+
+#------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('curve', [False, True])
+@pytest.mark.parametrize('rows', [MAX_POINTS + 1, 20 * MAX_POINTS])
+def test_at_most_max_points(rows, curve):
+
+    df = frame(rows)
+    decimated = decimate(df, 'date', 'altitude', curve=curve)
+
+    assert 0 < len(decimated) <= MAX_POINTS
+    assert decimated.index.is_monotonic_increasing
+    assert set(decimated['category_translated']) == set(df['category_translated'])
+
+
+@pytest.mark.parametrize('curve', [False, True])
+def test_frames_that_fit_are_kept(curve):
+
+    df = frame(MAX_POINTS)
+
+    assert decimate(df, 'date', 'altitude', curve=curve) is df
+
+
+def test_curve_keeps_the_envelope():
+
+    df = frame(10 * MAX_POINTS)
+    decimated = decimate(df, 'date', 'altitude', curve=True)
+
+    for extreme in ['idxmin', 'idxmax']:
+        assert set(getattr(df.groupby('category_translated')['altitude'], extreme)()) <= set(decimated.index)
+
+
+def test_webgl_from_webgl_points_on():
+
+    assert scatter(WEBGL_POINTS - 1) is go.Scatter
+    assert scatter(WEBGL_POINTS) is go.Scattergl
+
+
+def test_figure_traces(data_directory, metadata):
+
+    places = utilities.storage.load(metadata).places_by_altitude('en')
+    altitudes = (places['altitude'].min(), places['altitude'].max())
+    categories = places['category'].unique().tolist()
+
+    figure = utilities.waypoints_by_altitude(places, altitudes, categories, 'en', max_points=len(places) // 4)
+
+    assert sum(len(trace.x) for trace in figure.data) <= len(places) // 4
+    assert {type(trace) for trace in figure.data} == {scatter(len(places))}
@@ -0,0 +1,117 @@
+import os
+import pytest
+import utilities
+from utilities.misc import read_journal, drop_torn_line
+
+
+ENTRY = '{"table": "places", "row": {"waypoint": "A"}}\n'
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_truncated_last_line_is_ignored(tmp_path):
+
+    path = tmp_path / 'journal.jsonl'
+    path.write_text(ENTRY + '{"table": "places", "ro')
+
+    assert read_journal([str(path)]) == {'places': [{'waypoint': 'A'}], 'activities': []}
+
+
+def test_corrupted_line_raises(tmp_path):
+
+    path = tmp_path / 'journal.jsonl'
+    path.write_text('garbage\n' + ENTRY)
+
+    with pytest.raises(ValueError, match='line 1'):
+        read_journal([str(path)])
+
+
+def test_torn_line_is_dropped(tmp_path):
+
+    path = tmp_path / 'journal.jsonl'
+    path.write_text(ENTRY + '{"table": "pla')
+    drop_torn_line(str(path))
+
+    assert path.read_text() == ENTRY
+
+    drop_torn_line(str(path))
+    assert path.read_text() == ENTRY
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_saves_are_replayed(data_directory, metadata, place):
+
+    storage = utilities.JsonStorage()
+    dataset = storage.load(metadata)
+
+    storage.commit(dataset, lambda dataset: dataset.has_place(place['waypoint']), lambda dataset: dataset.add_place(place), lambda dataset: storage.save_place(dataset, place['waypoint']))
+
+    # A crash while writing the next save leaves a torn line: the save after it still reads back
+    with open(storage.journal, 'a') as file:
+        file.write('{"table": "places", "row": {"waypo')
+
+    reloaded = utilities.JsonStorage().load(metadata)
+    assert reloaded.has_place(place['waypoint'])
+    assert len(reloaded.places) == len(dataset.places) + 1
+
+    second = dict(place, waypoint='Second summit')
+    storage.commit(reloaded, lambda dataset: dataset.has_place(second['waypoint']), lambda dataset: dataset.add_place(second), lambda dataset: storage.save_place(dataset, second['waypoint']))
+
+    reloaded = utilities.JsonStorage().load(metadata)
+    assert reloaded.has_place(place['waypoint']) and reloaded.has_place(second['waypoint'])
+
+
+def test_compaction(data_directory, metadata, place):
+
+    storage = utilities.JsonStorage(compact_every=2)
+    dataset = storage.load(metadata)
+
+    for number in range(2):
+        name = f"{place['waypoint']} {number}"
+        dataset = storage.commit(dataset, lambda dataset: dataset.has_place(name), lambda dataset: dataset.add_place(dict(place, waypoint=name)), lambda dataset: storage.save_place(dataset, name))
+
+    storage.compaction.join()
+
+    assert not os.path.exists(storage.journal + '.compacting')
+    assert read_journal(storage.journals()) == {'places': [], 'activities': []}
+
+    reloaded = utilities.load_data(metadata)
+    assert reloaded.has_place(f"{place['waypoint']} 0") and reloaded.has_place(f"{place['waypoint']} 1")
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_write_conflict(data_directory, metadata, place):
+
+    storage = utilities.JsonStorage()
+    base = storage.load(metadata)
+
+    def add(dataset, row):
+        return storage.commit(dataset, lambda dataset: dataset.has_place(row['waypoint']), lambda dataset: dataset.add_place(row), lambda dataset: storage.save_place(dataset, row['waypoint']))
+
+    # Another worker saved since base was loaded: another place is added to the current data...
+    add(base, place)
+    other = dict(place, waypoint='Other summit')
+    dataset = add(base, other)
+    assert dataset.has_place(place['waypoint']) and dataset.has_place(other['waypoint'])
+
+    # ... the same one is a conflict, with the current data
+    with pytest.raises(utilities.WriteConflict) as conflict:
+        add(base, place)
+    assert conflict.value.dataset.has_place(place['waypoint'])
+
+
+def test_compaction_counts_the_saves_of_every_worker(data_directory, metadata, place):
+
+    workers = [utilities.JsonStorage(compact_every=3), utilities.JsonStorage(compact_every=3)]
+    dataset = workers[0].load(metadata)
+
+    for number in range(3):
+        storage = workers[number % 2]
+        name = f"{place['waypoint']} {number}"
+        dataset = storage.commit(dataset, lambda dataset: dataset.has_place(name), lambda dataset: dataset.add_place(dict(place, waypoint=name)), lambda dataset: storage.save_place(dataset, name))
+
+    # Third save overall, second one of the first worker
+    assert workers[1].compaction is None
+    workers[0].compaction.join()
+
+    assert read_journal(workers[0].journals()) == {'places': [], 'activities': []}
+    assert all(utilities.load_data(metadata).has_place(f"{place['waypoint']} {number}") for number in range(3))
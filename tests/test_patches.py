@@ -0,0 +1,47 @@
+import plotly.graph_objects as go
+from dash import no_update
+import utilities
+
+
+def figure(*ys, **layout):
+    return go.Figure([go.Scatter(y=y) for y in ys], layout=layout)
+
+
+def operations(patch) -> list:
+    return [(item['operation'], item['location']) for item in patch.to_plotly_json()['operations']]
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_same_figure_is_not_sent():
+
+    rendered = figure([1, 2], [3, 4], title='Title')
+
+    assert utilities.figure_patch(rendered, utilities.figure_digest(rendered), utilities.figure_digest(rendered)) is no_update
+
+
+def test_first_figure_or_new_traces_are_sent_whole():
+
+    new = figure([1, 2], [3, 4])
+
+    assert utilities.figure_patch(new, utilities.figure_digest(new), None) is new
+    assert utilities.figure_patch(new, utilities.figure_digest(new), utilities.figure_digest(figure([1, 2]))) is new
+
+
+def test_only_changed_traces_and_keys_are_sent():
+
+    rendered = figure([1, 2], [3, 4], title='Title')
+    new = figure([1, 2], [3, 5], title='Other title')
+
+    patch = utilities.figure_patch(new, utilities.figure_digest(new), utilities.figure_digest(rendered))
+
+    assert sorted(operations(patch)) == [('Assign', ['data', 1]), ('Assign', ['layout', 'title'])]
+
+
+def test_layout_keys_of_another_chart_are_deleted():
+
+    rendered = figure([1, 2], xaxis={'showticklabels': False}, uirevision='curve')
+    new = figure([1, 2])
+
+    patch = utilities.figure_patch(new, utilities.figure_digest(new), utilities.figure_digest(rendered))
+
+    assert sorted(operations(patch)) == [('Delete', ['layout', 'uirevision']), ('Delete', ['layout', 'xaxis'])]
@@ -0,0 +1,45 @@
+import os
+import pandas as pd
+import utilities
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_snapshot_reads_back_the_json_data(data_directory, metadata):
+
+    storage = utilities.JsonStorage()
+    parsed = storage.load(metadata)
+    assert os.path.exists(os.path.join(storage.snapshot, 'manifest.json'))
+
+    snapshot = utilities.snapshot.read(storage.snapshot, [storage.places, storage.activities], metadata)
+    assert snapshot is not None
+
+    for table in utilities.snapshot.TABLES:
+        pd.testing.assert_frame_equal(getattr(snapshot, table), getattr(parsed, table))
+
+    assert snapshot.index.by_waypoint.keys() == parsed.index.by_waypoint.keys()
+
+
+def test_snapshot_is_stale_when_the_sources_change(data_directory, metadata):
+
+    storage = utilities.JsonStorage()
+    storage.load(metadata)
+    sources = [storage.places, storage.activities]
+
+    with open(storage.places, 'a') as file:
+        file.write(' ')
+
+    assert utilities.snapshot.read(storage.snapshot, sources, metadata) is None
+
+    # Written again on the next load
+    storage.load(metadata)
+    assert utilities.snapshot.read(storage.snapshot, sources, metadata) is not None
+
+
+def test_snapshot_is_stale_when_the_metadata_changes(data_directory, metadata):
+
+    storage = utilities.JsonStorage()
+    storage.load(metadata)
+
+    changed = dict(metadata, activity={**metadata['activity'], 'new sport': {'grades': {'easy': 1}}})
+
+    assert utilities.snapshot.read(storage.snapshot, [storage.places, storage.activities], changed) is None
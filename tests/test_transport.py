@@ -0,0 +1,103 @@
+import gzip
+import json
+import dash
+import pytest
+from dash import dcc, html, Input, Output
+import utilities
+
+
+VERSION = '0123456789abcdef-01234567'
+
+
+@pytest.fixture
+def app():
+    '''
+    App with one store holding a data version, and a callback counting its calls
+    '''
+
+    app = dash.Dash(__name__)
+    app.layout = html.Div([dcc.Store(id='store', data=VERSION), html.Div(id='output'), html.Div(id='other')])
+    app.calls = []
+
+    @app.callback(Output('output', 'children'), Input('store', 'data'))
+    def output(version):
+        app.calls.append(version)
+        return 'x' * 2000
+
+    @app.callback(Output('other', 'children'), Input('store', 'data'))
+    def other(version):
+        app.calls.append(version)
+        return version
+
+    utilities.cache_responses(app, lambda: VERSION, {'output.children'})
+    utilities.compress(app)
+
+    yield app
+
+    utilities.figure_cache.expire(VERSION)
+
+
+def request(output: str, version = VERSION) -> dict:
+    return {
+        'output'        : output,
+        'outputs'       : {'id': output.split('.')[0], 'property': 'children'},
+        'inputs'        : [{'id': 'store', 'property': 'data', 'value': version}],
+        'changedPropIds': [],
+    }
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_layout_revalidated_with_etag(app):
+
+    client = app.server.test_client()
+
+    response = client.get('/_dash-layout')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert etag.startswith('W/')
+
+    response = client.get('/_dash-layout', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # Same content compressed: same (weak) ETag
+    response = client.get('/_dash-layout', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 304
+
+    response = client.get('/_dash-dependencies', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_callback_responses_cached_per_version(app):
+
+    client = app.server.test_client()
+
+    first = client.post('/_dash-update-component', json=request('output.children'), headers={'Accept-Encoding': 'gzip'})
+    second = client.post('/_dash-update-component', json=request('output.children'))
+    assert app.calls == [VERSION]
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(first.data)) == json.loads(second.data)
+    assert first.headers['ETag'] == second.headers['ETag']
+
+    assert client.post('/_dash-update-component', json=request('output.children'), headers={'If-None-Match': second.headers['ETag']}).status_code == 304
+
+    # Expiring the version drops its responses
+    utilities.figure_cache.expire(VERSION)
+    client.post('/_dash-update-component', json=request('output.children'))
+    assert app.calls == [VERSION, VERSION]
+
+
+def test_other_callbacks_are_not_cached(app):
+
+    client = app.server.test_client()
+
+    for _ in range(2):
+        response = client.post('/_dash-update-component', json=request('other.children'))
+        assert 'ETag' not in response.headers
+
+    # No data version in the request: not cached either
+    for _ in range(2):
+        client.post('/_dash-update-component', json=request('output.children', version=None))
+
+    assert app.calls == [VERSION, VERSION, None, None]
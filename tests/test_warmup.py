@@ -0,0 +1,71 @@
+import time
+import dash
+import pytest
+from dash import html, Input, Output
+import utilities
+
+
+@pytest.fixture
+def app():
+    '''
+    App with one callback per page, the 'broken' one failing until app.broken is cleared
+    '''
+
+    app = dash.Dash(__name__)
+    app.layout = html.Div([html.Div(id='language', children='en'), html.Div(id='page', children='home'), html.Div(id='fine'), html.Div(id='broken')])
+    app.calls = []
+    app.broken = True
+
+    @app.callback(Output('fine', 'children'), Input('page', 'children'), Input('language', 'children'))
+    def fine(page, language):
+        app.calls.append(('fine', page, language))
+        return page
+
+    @app.callback(Output('broken', 'children'), Input('page', 'children'), Input('language', 'children'))
+    def broken(page, language):
+        app.calls.append(('broken', page, language))
+        if app.broken:
+            raise RuntimeError('broken')
+        return page
+
+    return app
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_every_page_in_every_language(app):
+
+    warm_up = utilities.WarmUp()
+    warm_up.run(app, {'fine.children': {'page.children': 'stats'}})
+
+    assert warm_up.ready and warm_up.status()['failed'] == 0
+    assert sorted(app.calls) == sorted(('fine', 'stats', language) for language in utilities.LANGUAGES)
+
+
+def test_failures_are_retried_then_not_ready(app):
+
+    warm_up = utilities.WarmUp(attempts=2, retry_delay=0)
+    warm_up.run(app, {'broken.children': {}})
+
+    status = warm_up.status()
+    assert not warm_up.ready
+    assert status['attempt'] == 2 and status['failed'] == len(utilities.LANGUAGES)
+    assert len(app.calls) == 2 * len(utilities.LANGUAGES)
+
+
+def test_ready_once_an_attempt_succeeds(app):
+
+    warm_up = utilities.WarmUp(attempts=3, retry_delay=0.2)
+    warm_up.start(app, {'broken.children': {}})
+    client = app.server.test_client()
+
+    while warm_up.status()['attempt'] < 1 or not warm_up.status()['failed']:
+        time.sleep(0.01)
+    assert client.get('/ready').status_code == 503
+
+    app.broken = False
+    while warm_up.finished is None:
+        time.sleep(0.01)
+
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] and response.get_json()['attempt'] == 2
@@ -0,0 +1,58 @@
+import pytest
+import utilities
+
+
+def brute_force(activities) -> dict:
+    '''
+    waypoint -> ids of the activities listing it, from the waypoints column
+    '''
+
+    visits = {}
+    for id, waypoints in zip(activities['id'], activities['waypoints']):
+        for waypoint in (waypoints or '').split(', '):
+            if waypoint:
+                visits.setdefault(waypoint, set()).add(int(id))
+
+    return visits
+
+
+def assert_exact(dataset):
+
+    expected = brute_force(dataset.activities)
+
+    assert set(dataset.index.by_waypoint) == set(expected)
+    for waypoint, ids in expected.items():
+        found = dataset.index.activities(waypoint)
+        assert len(found) == len(ids) and set(found.tolist()) == ids
+    for id in dataset.activities['id']:
+        assert set(dataset.index.waypoints(int(id))) == {waypoint for waypoint, ids in expected.items() if int(id) in ids}
+
+
+@pytest.fixture
+def dataset(data_directory, metadata):
+    return utilities.storage.load(metadata)
+
+
+#------------------------------------------------------------------------------------------------------------
+def test_lookups_are_exact(dataset):
+
+    assert_exact(dataset)
+    assert len(dataset.index.activities('No such place')) == 0
+
+
+def test_lookups_stay_exact_after_saves(dataset, place):
+
+    before = dataset.index
+    first, last = (int(id) for id in dataset.activities['id'].iloc[[0, -1]])
+    waypoints = before.waypoints(first)
+    assert waypoints
+
+    # Waypoints moved from one activity to another, listed twice, or dropped
+    dataset = dataset.upsert_activity(first, dict(dataset.activity(first), waypoints=None))
+    dataset = dataset.upsert_activity(last, dict(dataset.activity(last), waypoints=', '.join(waypoints + waypoints[:1] + [place['waypoint']])))
+    dataset = dataset.upsert_activity(last + 1, dict(dataset.activity(last), waypoints=place['waypoint']))
+    assert_exact(dataset)
+
+    # Earlier indexes are left untouched
+    assert before.waypoints(first) == waypoints
+    assert all(first in before.activities(waypoint) for waypoint in waypoints)
@@ -1,3 +1,15 @@
-from utilities.misc import load_data, massage_activity_data, places_dict_to_df, activities_dict_to_df
+from utilities.spatial import PlaceIndex
+from utilities.decimation import decimate
+from utilities.aggregates import YearlyAggregates
+from utilities.dataset import Dataset, table_query
+from utilities.misc import load_data, read_journal, massage_activity_data
 from utilities.figures import *
-from utilities.translation import translation
\ No newline at end of file
+from utilities.translation import translation
+from utilities.settings import settings, Settings, LANGUAGES
+from utilities.datastore import datastore, DataStore, MemoryBackend, DiskBackend, InvalidVersion, check_version
+from utilities.storage import storage, JsonStorage, SqliteStorage, WriteConflict
+from utilities.cache import figure_cache, FigureCache
+from utilities.patches import figure_digest, figure_patch
+from utilities.instrumentation import instrument, metrics
+from utilities.transport import use_json_engine, compress, cache_responses
+from utilities.warmup import warm_up, WarmUp
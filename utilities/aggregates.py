@@ -0,0 +1,117 @@
+import pandas as pd
+import utilities
+
+
+#------------------------------------------------------------------------------------------------------------
+def combine(
+    total  : pd.Series,
+    removed: pd.Series,
+    added  : pd.Series,
+) -> pd.Series:
+
+    if len(removed):
+        total = total.sub(removed, fill_value=0)
+    if len(added):
+        total = total.add(added, fill_value=0)
+
+    return total[total != 0].sort_index()
+
+
+#------------------------------------------------------------------------------------------------------------
+class YearlyAggregates:
+    '''
+    Yearly totals behind the stats figures: days by (year, category), days by (year, context, role)
+    and visited waypoints by (year, place category). Keys are untranslated.
+    Computed once per dataset, then updated from the rows that changed: figures built from them
+    cost the same whatever the number of activities.
+    '''
+
+    def __init__(
+        self,
+        days     : pd.Series,
+        contexts : pd.Series,
+        waypoints: pd.Series,
+    ):
+        self.days = days
+        self.contexts = contexts
+        self.waypoints = waypoints
+
+    @classmethod
+    def from_frames(
+        cls,
+        places    : pd.DataFrame,
+        activities: pd.DataFrame,
+        waypoints : pd.DataFrame,
+        visits    : pd.DataFrame = None,
+    ):
+        '''
+        waypoints: (id, waypoint) pairs of these activities, see Dataset.waypoints
+        visits: the same pairs already merged with year and place category, see Dataset.visits
+        '''
+
+        year = activities['year'].astype(int)
+        category = activities['category'].astype(object)
+        context = activities['context'].astype(object)
+        role = activities['role'].astype(object).fillna('?')
+
+        if visits is None:
+            visits = utilities.get_waypoints_overtime(places, activities, waypoints)
+
+        return cls(
+            activities.groupby([year, category])['days'].sum(),
+            activities.groupby([year, context, role])['days'].sum(),
+            visits.groupby([visits['year'].astype(int), visits['category'].astype(object)])['waypoint'].count(),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls(pd.Series(dtype=float), pd.Series(dtype=float), pd.Series(dtype=int))
+
+    def update(
+        self,
+        removed,
+        added,
+    ):
+        '''
+        New aggregates, without the removed rows' contribution and with the added ones'
+        '''
+
+        return YearlyAggregates(
+            combine(self.days, removed.days, added.days),
+            combine(self.contexts, removed.contexts, added.contexts),
+            combine(self.waypoints, removed.waypoints, added.waypoints),
+        )
+
+    # Translated frames, ready for the figures
+    #--------------------------------------------------------------------------------------------------------
+    def days_for(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+
+        df = self.days.rename_axis(['year', 'category']).rename('days').reset_index()
+        df['category_translated'] = df['category'].map(utilities.settings.translation_map('activities', language))
+
+        return df.dropna(subset=['category_translated']).sort_values(['year', 'category_translated'], ignore_index=True)
+
+    def contexts_for(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+
+        df = self.contexts.rename_axis(['year', 'context', 'role']).rename('days').reset_index()
+        df['context'] = df['context'].map(utilities.settings.translation_map('contexts', language))
+        df['role'] = df['role'].map(utilities.settings.translation_map('roles', language)).fillna('?')
+        df = df.dropna(subset=['context'])
+
+        return df.groupby(['year', 'context', 'role'])['days'].sum().reset_index()
+
+    def waypoints_for(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+
+        df = self.waypoints.astype(int).rename_axis(['year', 'category']).rename('waypoint').reset_index()
+        df['category_translated'] = df['category'].map(utilities.settings.translation_map('places', language))
+
+        return df.dropna(subset=['category_translated']).sort_values(['year', 'category_translated'], ignore_index=True)
@@ -0,0 +1,132 @@
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+
+
+#------------------------------------------------------------------------------------------------------------
+def normalize(
+    value
+):
+    '''
+    Hashable, canonical form of callback inputs: lists to tuples, sets sorted, numpy to python
+    '''
+
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(normalize(item) for item in value))
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item)) for key, item in value.items()))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+#------------------------------------------------------------------------------------------------------------
+def estimate_size(
+    value
+) -> int:
+    '''
+    Rough size in bytes of a figure (or any json-like value) once serialized
+    '''
+
+    if hasattr(value, 'to_plotly_json'):
+        value = value.to_plotly_json()
+
+    if isinstance(value, dict):
+        return sum(len(str(key)) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value) + len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value)
+
+    return 8
+
+
+#------------------------------------------------------------------------------------------------------------
+class FigureCache:
+    '''
+    Bounded LRU cache of figures, keyed by dataset versions + normalized filters.
+    Hits and misses are counted per name.
+    '''
+
+    def __init__(
+        self,
+        max_entries = 128,
+        max_bytes   = 256 * 2**20,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(
+        self,
+        name    : str,
+        versions: tuple,
+        inputs  : tuple,
+        build,
+    ):
+        '''
+        Cached result of build(), computed on first use of (name, versions, inputs)
+        '''
+
+        key = (name, tuple(versions), normalize(inputs))
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits[name] += 1
+                return self.entries[key][0]
+            self.misses[name] += 1
+
+        value = build()
+        size = estimate_size(value)
+
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (value, size)
+                self.bytes += size
+                self.evict()
+
+        return value
+
+    def evict(self):
+
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def expire(
+        self,
+        version: str
+    ):
+        '''
+        Drop entries built from a dataset version that was just replaced
+        '''
+
+        with self.lock:
+            for key in [key for key in self.entries if version in key[1]]:
+                _, size = self.entries.pop(key)
+                self.bytes -= size
+
+    def stats(self) -> dict:
+
+        with self.lock:
+            return {
+                'entries'  : len(self.entries),
+                'bytes'    : self.bytes,
+                'hits'     : sum(self.hits.values()),
+                'misses'   : sum(self.misses.values()),
+                'evictions': self.evictions,
+            }
+
+
+figure_cache = FigureCache()
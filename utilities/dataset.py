@@ -0,0 +1,550 @@
+import numpy as np
+import pandas as pd
+import utilities
+
+
+PLACES_COLUMNS     = ['waypoint', 'latitude', 'longitude', 'altitude', 'category']
+ACTIVITIES_COLUMNS = ['id', 'label', 'category', 'grade', 'date', 'days', 'context', 'role', 'waypoints', 'participants', 'topo', 'comments']
+
+
+#------------------------------------------------------------------------------------------------------------
+def categorical(
+    values    : pd.Series,
+    categories: list
+) -> pd.Series:
+    '''
+    Categorical column, known categories first then whatever else is found in the data
+    '''
+
+    categories = list(categories) + [value for value in values.dropna().unique() if value not in categories]
+
+    return pd.Categorical(values, categories=categories)
+
+
+#------------------------------------------------------------------------------------------------------------
+def typed_places(
+    places: pd.DataFrame,
+) -> pd.DataFrame:
+
+    places = places[PLACES_COLUMNS].reset_index(drop=True)
+    places['latitude'] = places['latitude'].astype(float)
+    places['longitude'] = places['longitude'].astype(float)
+    places['altitude'] = places['altitude'].astype(int)
+    places['category'] = categorical(places['category'], utilities.translation['places'])
+
+    return places
+
+
+#------------------------------------------------------------------------------------------------------------
+def typed_activities(
+    activities: pd.DataFrame,
+    metadata  : dict,
+) -> pd.DataFrame:
+
+    if len(activities):
+        activities = utilities.massage_activity_data(activities.copy(), metadata['activity'])
+    else:
+        activities = activities.assign(grade_num=np.nan, year=None)
+
+    grades = utilities.misc.grade_scale(metadata['activity'])['grade']
+
+    activities['id'] = activities['id'].astype(int)
+    activities['date'] = pd.to_datetime(activities['date'])
+    activities['category'] = categorical(activities['category'], utilities.translation['activities'])
+    activities['grade'] = categorical(activities['grade'], dict.fromkeys(grades))
+    activities['context'] = categorical(activities['context'], utilities.translation['contexts'])
+    activities['role'] = categorical(activities['role'], utilities.translation['roles'])
+
+    return activities
+
+
+#------------------------------------------------------------------------------------------------------------
+def explode_waypoints(
+    activities: pd.DataFrame,
+) -> pd.DataFrame:
+    '''
+    One row per (activity, waypoint)
+    '''
+
+    df = activities[['id', 'waypoints']].dropna()
+    df = df.assign(waypoint=df['waypoints'].str.split(', ')).explode('waypoint')
+
+    return df[['id', 'waypoint']].reset_index(drop=True)
+
+
+#------------------------------------------------------------------------------------------------------------
+FILTER_TYPES = {'like', 'starts', 'ends', '=', '!='}
+
+def table_query(
+    filters,
+    sorters,
+    columns,
+) -> tuple:
+    '''
+    Checked (filters, sorters) of a table request, as sent by Tabulator: {field, type, value} and
+    {field, dir} of known columns. ValueError when anything is malformed.
+    '''
+
+    columns = set(columns)
+    filters = filters or []
+    sorters = sorters or []
+
+    if not isinstance(filters, list) or not all(
+        isinstance(item, dict) and
+        isinstance(item.get('field'), str) and item['field'] in columns and
+        isinstance(item.get('type'), str) and item['type'] in FILTER_TYPES and
+        isinstance(item.get('value'), (str, int, float, type(None)))
+        for item in filters
+    ):
+        raise ValueError('filters must be {field, type, value} of known columns')
+
+    if not isinstance(sorters, list) or not all(
+        isinstance(item, dict) and isinstance(item.get('field'), str) and item['field'] in columns and
+        item.get('dir') in ('asc', 'desc')
+        for item in sorters
+    ):
+        raise ValueError('sorters must be {field, dir} of known columns')
+
+    return filters, sorters
+
+
+def header_filter(
+    values: pd.Series,
+    type  : str,
+    value,
+) -> np.ndarray:
+    '''
+    Rows matching one Tabulator filter, compared as displayed: 'like' is a case-insensitive substring
+    '''
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = values.dt.strftime('%Y-%m-%d')
+    values = values.astype(str).where(values.notna(), '')
+    value = str(value)
+
+    if type == 'like':
+        return values.str.contains(value, case=False, regex=False).to_numpy()
+    if type == 'starts':
+        return values.str.lower().str.startswith(value.lower()).to_numpy()
+    if type == 'ends':
+        return values.str.lower().str.endswith(value.lower()).to_numpy()
+    if type == '=':
+        return (values == value).to_numpy()
+    if type == '!=':
+        return (values != value).to_numpy()
+
+    raise ValueError(f'Unsupported filter: {type}')
+
+
+#------------------------------------------------------------------------------------------------------------
+class WaypointIndex:
+    '''
+    Inverted index waypoint -> activity ids, and the reverse activity id -> waypoints.
+    Updates return a new index, entries of the previous one are left untouched.
+    '''
+
+    def __init__(
+        self,
+        by_waypoint: dict,
+        by_activity: dict,
+    ):
+        self.by_waypoint = by_waypoint
+        self.by_activity = by_activity
+
+    @classmethod
+    def from_waypoints(
+        cls,
+        waypoints: pd.DataFrame
+    ):
+
+        ids = waypoints['id'].to_numpy()
+        names = waypoints['waypoint'].to_numpy()
+
+        return cls(
+            {waypoint: ids[rows] for waypoint, rows in waypoints.groupby('waypoint').indices.items()},
+            {id: list(names[rows]) for id, rows in waypoints.groupby('id').indices.items()},
+        )
+
+    def activities(
+        self,
+        waypoint: str
+    ) -> np.ndarray:
+        return self.by_waypoint.get(waypoint, np.array([], dtype=int))
+
+    def waypoints(
+        self,
+        id: int
+    ) -> list:
+        return self.by_activity.get(id, [])
+
+    def visits(
+        self,
+        ids = None
+    ) -> pd.Series:
+        '''
+        Number of activities per waypoint, among all activities or those ids only
+        '''
+
+        if ids is None:
+            return pd.Series({waypoint: len(activities) for waypoint, activities in self.by_waypoint.items()}, dtype=int)
+
+        return pd.Series([waypoint for id in ids for waypoint in self.waypoints(id)], dtype=object).value_counts()
+
+    def update(
+        self,
+        id       : int,
+        waypoints: list
+    ):
+
+        by_waypoint = dict(self.by_waypoint)
+        by_activity = dict(self.by_activity)
+
+        for waypoint in self.waypoints(id):
+            by_waypoint[waypoint] = by_waypoint[waypoint][by_waypoint[waypoint]!=id]
+            if len(by_waypoint[waypoint]) == 0:
+                del by_waypoint[waypoint]
+
+        for waypoint in dict.fromkeys(waypoints):
+            by_waypoint[waypoint] = np.append(by_waypoint.get(waypoint, np.array([], dtype=int)), id)
+
+        by_activity[id] = list(waypoints)
+        if not waypoints:
+            del by_activity[id]
+
+        return WaypointIndex(by_waypoint, by_activity)
+
+
+#------------------------------------------------------------------------------------------------------------
+class Dataset:
+    '''
+    Places and activities as typed columnar frames, built once at load and updated on save.
+    Instances are never modified: saving returns a new Dataset, so frames can be shared.
+    saved_id is the id of the activity written by upsert_activity, for storage to save that row only.
+    stamp is the storage stamp the data was loaded from (see Coordinated).
+    '''
+
+    def __init__(
+        self,
+        places    : pd.DataFrame,
+        activities: pd.DataFrame,
+        waypoints : pd.DataFrame,
+        metadata  : dict,
+        index     : WaypointIndex = None,
+    ):
+        self.places = places
+        self.activities = activities
+        self.waypoints = waypoints
+        self.metadata = metadata
+        self.index = index or WaypointIndex.from_waypoints(waypoints)
+        self.saved_id = None
+        self.stamp = None
+        self.version = None
+        self.derived = {}
+
+    def __getstate__(self):
+
+        # Derived frames and indexes are rebuilt on use, and may be added while the dataset is pickled
+        return dict(self.__dict__, derived={})
+
+    @classmethod
+    def from_frames(
+        cls,
+        places    : pd.DataFrame,
+        activities: pd.DataFrame,
+        metadata  : dict,
+    ):
+
+        places = typed_places(places)
+        activities = typed_activities(activities, metadata).sort_values(by='date', ascending=False)
+
+        return cls(places, activities, explode_waypoints(activities), metadata)
+
+    @classmethod
+    def empty(
+        cls,
+        metadata: dict
+    ):
+        return cls.from_frames(pd.DataFrame(columns=PLACES_COLUMNS), pd.DataFrame(columns=ACTIVITIES_COLUMNS), metadata)
+
+    # Read
+    #--------------------------------------------------------------------------------------------------------
+    def has_place(
+        self,
+        waypoint: str
+    ) -> bool:
+
+        if 'place_names' not in self.derived:
+            self.derived['place_names'] = pd.Index(self.places['waypoint'])
+
+        return waypoint in self.derived['place_names']
+
+    def place_index(self) -> utilities.PlaceIndex:
+        '''
+        Spatial and altitude index over the places, built on first use
+        '''
+
+        if 'place_index' not in self.derived:
+            self.derived['place_index'] = utilities.PlaceIndex(self.places)
+
+        return self.derived['place_index']
+
+    def visits(
+        self,
+        filter_waypoint: str = None
+    ) -> pd.DataFrame:
+        '''
+        Fact table of the visits: one row per (activity, visited place) with date, year and the place's
+        category, altitude and position. Built once per dataset, i.e. when places or activities change,
+        shared by the figures and the aggregates. Do not modify.
+        '''
+
+        if 'visits' not in self.derived:
+            self.derived['visits'] = utilities.get_waypoints_overtime(self.places, self.activities, self.waypoints)
+
+        visits = self.derived['visits']
+
+        if filter_waypoint:
+            return visits[visits['id'].isin(self.index.activities(filter_waypoint))]
+
+        return visits
+
+    def waypoints_overtime(
+        self,
+        language       : str,
+        filter_waypoint: str = None
+    ) -> pd.DataFrame:
+        '''
+        Visits with translated place category, see visits
+        '''
+
+        visits = self.visits(filter_waypoint)
+        visits = visits.assign(category_translated=visits['category'].map(utilities.settings.translation_map('places', language)))
+
+        return visits.dropna(subset=['category_translated'])
+
+    def aggregates(
+        self,
+        filter_waypoint: str = None
+    ) -> utilities.YearlyAggregates:
+        '''
+        Yearly totals of all activities (kept up to date on save), or of those visiting that waypoint
+        '''
+
+        if filter_waypoint:
+            ids = self.index.activities(filter_waypoint)
+            return utilities.YearlyAggregates.from_frames(
+                self.places,
+                self.activities[self.activities['id'].isin(ids)],
+                self.waypoints[self.waypoints['id'].isin(ids)],
+                self.visits(filter_waypoint)
+            )
+
+        if 'aggregates' not in self.derived:
+            self.derived['aggregates'] = utilities.YearlyAggregates.from_frames(self.places, self.activities, self.waypoints, self.visits())
+
+        return self.derived['aggregates']
+
+    def activity(
+        self,
+        id: int
+    ) -> dict:
+        '''
+        Raw values of one activity, as entered in the form
+        '''
+
+        activity = self.activities[self.activities['id']==id][ACTIVITIES_COLUMNS].iloc[0]
+        activity = activity.astype(object).where(activity.notna(), None).to_dict()
+        activity['date'] = activity['date'].strftime('%Y-%m-%d')
+
+        return activity
+
+    def places_for(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+        '''
+        Places with translated category (plain labels, for the figures). Cached, do not modify.
+        '''
+
+        key = ('places', language)
+
+        if key not in self.derived:
+            places = self.places.copy()
+            places['category_translated'] = utilities.settings.translate(places['category'], 'places', language)
+            self.derived[key] = places
+
+        return self.derived[key]
+
+    def places_by_altitude(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+        '''
+        places_for(language) sorted by altitude, for the altitude curve. Cached, do not modify.
+        '''
+
+        key = ('places_by_altitude', language)
+
+        if key not in self.derived:
+            self.derived[key] = self.places_for(language).sort_values('altitude', kind='stable')
+
+        return self.derived[key]
+
+    def activities_for(
+        self,
+        language: str
+    ) -> pd.DataFrame:
+        '''
+        Activities with translated category, context and role. Cached, do not modify.
+        '''
+
+        key = ('activities', language)
+
+        if key not in self.derived:
+            activities = self.activities.copy()
+            activities['category_translated'] = utilities.settings.translate(activities['category'], 'activities', language)
+            activities['context_translated'] = utilities.settings.translate(activities['context'], 'contexts', language)
+            activities['role_translated'] = utilities.settings.translate(activities['role'], 'roles', language)
+            self.derived[key] = activities
+
+        return self.derived[key]
+
+    def activities_query(
+        self,
+        language       : str,
+        filter_waypoint: str  = None,
+        filters        : list = (),
+        sorters        : list = (),
+    ) -> np.ndarray:
+        '''
+        Rows of the activities table, as positions in activities_for(language): activities visiting that
+        waypoint and matching the header filters ({field, type, value}), sorted by the sorters ({field, dir},
+        the first one first). Default order: latest first. ValueError when filters or sorters are malformed.
+        '''
+
+        activities = self.activities_for(language)
+        filters, sorters = table_query(filters, sorters, activities.columns)
+        selected = np.ones(len(activities), dtype=bool)
+
+        if filter_waypoint:
+            selected &= activities['id'].isin(self.index.activities(filter_waypoint)).to_numpy()
+
+        for item in filters:
+            if item['value'] not in (None, ''):
+                selected &= header_filter(activities[item['field']], item['type'], item['value'])
+
+        rows = np.flatnonzero(selected)
+
+        if sorters:
+            order = activities.iloc[rows].reset_index(drop=True).sort_values(
+                by        = [item['field'] for item in sorters],
+                ascending = [item['dir']=='asc' for item in sorters],
+                kind      = 'stable'
+            ).index
+            rows = rows[order]
+
+        return rows
+
+    # Update, returns a new Dataset
+    #--------------------------------------------------------------------------------------------------------
+    def add_place(
+        self,
+        place: dict
+    ):
+
+        places = typed_places(pd.DataFrame([place]))
+        places = pd.concat([self.places, places], ignore_index=True)
+        places['category'] = categorical(places['category'].astype(object), self.places['category'].cat.categories)
+
+        dataset = Dataset(places, self.activities, self.waypoints, self.metadata, self.index)
+        dataset.stamp = self.stamp
+
+        # Activities already listing that waypoint now count in the yearly waypoint totals
+        if 'aggregates' in self.derived:
+            visits = self.waypoints[self.waypoints['waypoint']==place['waypoint']]
+            added = utilities.YearlyAggregates.from_frames(places.iloc[[-1]], self.activities[self.activities['id'].isin(visits['id'])], visits)
+            dataset.derived['aggregates'] = self.derived['aggregates'].update(
+                utilities.YearlyAggregates.empty(),
+                utilities.YearlyAggregates(pd.Series(dtype=float), pd.Series(dtype=float), added.waypoints),
+            )
+
+        return dataset
+
+    def upsert_activity(
+        self,
+        id   : int,
+        entry: dict
+    ):
+
+        new = typed_activities(pd.DataFrame([dict(entry, id=id)]), self.metadata)
+
+        activities = pd.concat([self.activities[self.activities['id']!=id], new], ignore_index=True)
+        for column in ['category', 'grade', 'context', 'role']:
+            activities[column] = categorical(activities[column].astype(object), self.activities[column].cat.categories)
+        activities = activities.sort_values(by='date', ascending=False)
+
+        new_waypoints = explode_waypoints(new)
+        waypoints = pd.concat([self.waypoints[self.waypoints['id']!=id], new_waypoints], ignore_index=True)
+        index = self.index.update(id, new_waypoints['waypoint'].tolist())
+
+        dataset = Dataset(self.places, activities, waypoints, self.metadata, index)
+        dataset.saved_id = id
+        dataset.stamp = self.stamp
+
+        if 'aggregates' in self.derived:
+            dataset.derived['aggregates'] = self.derived['aggregates'].update(
+                utilities.YearlyAggregates.from_frames(self.places, self.activities[self.activities['id']==id], self.waypoints[self.waypoints['id']==id]),
+                utilities.YearlyAggregates.from_frames(self.places, new, new_waypoints),
+            )
+
+        return dataset
+
+    def replay(
+        self,
+        journal: dict
+    ):
+        '''
+        Upserts recorded in a journal (see read_journal) applied at once, the last row of each key wins.
+        Only the journal rows are typed, e.g. on top of a snapshot.
+        '''
+
+        places, activities, waypoints = self.places, self.activities, self.waypoints
+
+        if journal['places']:
+            rows = typed_places(pd.DataFrame(journal['places']).drop_duplicates(subset='waypoint', keep='last'))
+            places = pd.concat([places[~places['waypoint'].isin(rows['waypoint'])], rows], ignore_index=True)
+            places['category'] = categorical(places['category'].astype(object), self.places['category'].cat.categories)
+
+        if journal['activities']:
+            rows = pd.DataFrame(journal['activities']).drop_duplicates(subset='id', keep='last')
+            rows = typed_activities(rows.reindex(columns=ACTIVITIES_COLUMNS), self.metadata)
+            activities = pd.concat([activities[~activities['id'].isin(rows['id'])], rows], ignore_index=True)
+            for column in ['category', 'grade', 'context', 'role']:
+                activities[column] = categorical(activities[column].astype(object), self.activities[column].cat.categories)
+            activities = activities.sort_values(by='date', ascending=False)
+            waypoints = pd.concat([waypoints[~waypoints['id'].isin(rows['id'])], explode_waypoints(rows)], ignore_index=True)
+
+        if places is self.places and activities is self.activities:
+            return self
+
+        dataset = Dataset(places, activities, waypoints, self.metadata)
+        dataset.stamp = self.stamp
+
+        return dataset
+
+    # Persist
+    #--------------------------------------------------------------------------------------------------------
+    def save_places(
+        self,
+        path = 'data_places.json'
+    ):
+        self.places[PLACES_COLUMNS].to_json(path, orient='table', index=False)
+
+    def save_activities(
+        self,
+        path = 'data_activities.json'
+    ):
+        activities = self.activities.sort_values(by='id')[ACTIVITIES_COLUMNS]
+        activities = activities.assign(date=activities['date'].dt.strftime('%Y-%m-%d'))
+        activities.to_json(path, orient='table', index=False)
+
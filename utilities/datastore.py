@@ -0,0 +1,235 @@
+import os
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import utilities
+
+
+VERSION_FORMAT = re.compile(r'[0-9a-f]{16}-[0-9a-f]{8}')   # as made by DataStore.put
+
+
+#------------------------------------------------------------------------------------------------------------
+class InvalidVersion(ValueError):
+    '''
+    Version token that DataStore.put cannot have made
+    '''
+
+
+def check_version(
+    version
+) -> str:
+    '''
+    version, when it has the format of a token: tokens come from the browser and name files of DiskBackend
+    '''
+
+    if not isinstance(version, str) or not VERSION_FORMAT.fullmatch(version):
+        raise InvalidVersion(f'Invalid data version: {version!r}')
+
+    return version
+
+
+#------------------------------------------------------------------------------------------------------------
+class MemoryBackend:
+    '''
+    In-process cache, bounded to the most recent entries. Shared by request and warm-up threads.
+    '''
+
+    def __init__(
+        self,
+        max_entries = 16
+    ):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def has(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+#------------------------------------------------------------------------------------------------------------
+class DiskBackend:
+    '''
+    Local disk cache (one pickle per entry), can be shared by several processes. The entries last used are
+    also kept in memory: a version never changes, and its derived frames and indexes are built once.
+    Entries are written in the background, saves do not wait for the whole dataset to be pickled.
+    '''
+
+    def __init__(
+        self,
+        directory   = 'cache',
+        max_entries = 4,
+        in_memory   = 2,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory = MemoryBackend(in_memory)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.writer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, check_version(key) + '.pkl')
+
+    def has(self, key):
+        return self.memory.has(key) or os.path.exists(self.path(key))
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        try:
+            with open(self.path(key), 'rb') as file:
+                value = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        '''
+        In memory now, on disk soon: of the entries set while one is written, only the last one is
+        '''
+
+        self.memory.set(check_version(key), value)
+
+        with self.lock:
+            self.pending = (key, value)
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_pending, daemon=True)
+                self.writer.start()
+
+    def write_pending(self):
+
+        while True:
+            with self.lock:
+                if self.pending is None:
+                    self.writer = None
+                    return
+                key, value = self.pending
+                self.pending = None
+
+            try:
+                self.write(key, value)
+            except (OSError, pickle.PicklingError) as error:
+                print('Error in DiskBackend.write: ', repr(error))
+
+    def write(self, key, value):
+        tmp = self.path(key) + '.tmp'
+        with open(tmp, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.pkl')]
+        entries.sort(key=os.path.getmtime)
+        for entry in entries[:-self.max_entries]:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+#------------------------------------------------------------------------------------------------------------
+def load_from_storage() -> utilities.Dataset:
+    '''
+    Current data, read again whenever storage changed
+    '''
+
+    return utilities.storage.load(utilities.settings.metadata)
+
+
+#------------------------------------------------------------------------------------------------------------
+class DataStore:
+    '''
+    Server-side data layer: the browser only holds a version token, callbacks resolve it here
+    '''
+
+    def __init__(
+        self,
+        backend = None,
+        loader  = load_from_storage
+    ):
+        self.backend = backend or MemoryBackend()
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.current_version = None
+
+    def use(self, backend):
+        self.backend = backend
+
+    def put(
+        self,
+        dataset: utilities.Dataset
+    ) -> str:
+        '''
+        Store a new version of the dataset, returns its token. Tokens sort chronologically.
+        '''
+
+        dataset.version = f'{time.time_ns():016x}-{uuid.uuid4().hex[:8]}'
+        self.backend.set(dataset.version, dataset)
+
+        return dataset.version
+
+    def current(self) -> str:
+        '''
+        Token of the current data. Storage is only read again when its fingerprint changed.
+        '''
+
+        fingerprint = utilities.storage.fingerprint()
+
+        with self.lock:
+            if fingerprint == self.fingerprint and self.backend.has(self.current_version):
+                return self.current_version
+
+            version = self.put(self.loader())
+            self.fingerprint = fingerprint
+            self.current_version = version
+
+        return version
+
+    def get(
+        self,
+        version: str
+    ) -> utilities.Dataset:
+        '''
+        Dataset of a version token, InvalidVersion when malformed. Unknown tokens (evicted, restart) get the
+        current data: nothing is loaded or stored for a token sent by the browser.
+        '''
+
+        dataset = self.backend.get(check_version(version))
+
+        if dataset is None:
+            dataset = self.backend.get(self.current())
+
+        return dataset
+
+    def latest(
+        self,
+        *versions: str
+    ) -> utilities.Dataset:
+        '''
+        Most recent of several versions, e.g. places_store and activities_store
+        '''
+
+        return self.get(max(check_version(version) for version in versions))
+
+
+datastore = DataStore()
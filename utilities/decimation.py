@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+WEBGL_POINTS = 1000     # from that many points on, scatter plots are drawn with WebGL (Scattergl)
+MAX_POINTS = 5000       # points sent per scatter plot, beyond that they are decimated
+
+
+#------------------------------------------------------------------------------------------------------------
+def numeric(
+    values
+) -> np.ndarray:
+    '''
+    Values as floats, dates as nanoseconds
+    '''
+
+    values = pd.Series(values)
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+
+    return values.to_numpy(dtype=float)
+
+
+def buckets(
+    values: np.ndarray,
+    count : int,
+) -> np.ndarray:
+    '''
+    Bucket (0 to count-1) of each value, among count equal-width intervals of their range
+    '''
+
+    low, high = values.min(), values.max()
+
+    if high == low:
+        return np.zeros(len(values), dtype=np.int64)
+
+    return np.minimum(((values - low) / (high - low) * count).astype(np.int64), count - 1)
+
+
+def scatter(
+    points: int
+):
+    '''
+    Scatter trace class for a plot of that many points (before zoom and decimation, so that zooming
+    keeps the same renderer): WebGL from WEBGL_POINTS on
+    '''
+
+    return go.Scattergl if points >= WEBGL_POINTS else go.Scatter
+
+
+#------------------------------------------------------------------------------------------------------------
+def relayout_view(
+    relayout: dict,
+    previous: dict = None,
+):
+    '''
+    Axis ranges of a cartesian plot after a zoom, pan or reset ({'x': [min, max], 'y': ...}, None for the
+    whole axis), starting from the previous ones. None if the event does not change them.
+    '''
+
+    if not relayout:
+        return None
+
+    view = dict(previous or {'x': None, 'y': None})
+    changed = False
+
+    for axis in ['x', 'y']:
+        if f'{axis}axis.range[0]' in relayout:
+            view[axis] = [relayout[f'{axis}axis.range[0]'], relayout[f'{axis}axis.range[1]']]
+        elif f'{axis}axis.range' in relayout:
+            view[axis] = list(relayout[f'{axis}axis.range'])
+        elif relayout.get(f'{axis}axis.autorange'):
+            view[axis] = None
+        else:
+            continue
+        changed = True
+
+    return view if changed else None
+
+
+def within(
+    frame: pd.DataFrame,
+    x    : str,
+    y    : str,
+    view : dict = None,
+) -> pd.DataFrame:
+    '''
+    Rows of frame inside the view (see relayout_view). Date ranges come as strings.
+    '''
+
+    if not view:
+        return frame
+
+    selected = np.ones(len(frame), dtype=bool)
+
+    for axis, column in [('x', x), ('y', y)]:
+        if view.get(axis) is None:
+            continue
+        values = frame[column]
+        bounds = pd.to_datetime(view[axis]) if pd.api.types.is_datetime64_any_dtype(values) else np.array(view[axis], dtype=float)
+        selected &= ((values >= min(bounds)) & (values <= max(bounds))).to_numpy()
+
+    return frame[selected]
+
+
+#------------------------------------------------------------------------------------------------------------
+def decimate(
+    frame     : pd.DataFrame,
+    x         : str,
+    y         : str,
+    max_points: int  = None,
+    curve     : bool = False,
+    group     = 'category_translated',
+) -> pd.DataFrame:
+    '''
+    At most max_points rows of frame, keeping the shape of y against x, per group (one trace each):
+    - curve: the envelope, lowest and highest y of each x interval (min/max per bucket)
+    - otherwise, a point cloud: one point per occupied cell of a grid, as coarse as needed
+    Frame as is when it fits. Rows keep their order.
+    '''
+
+    max_points = max_points or MAX_POINTS
+
+    if len(frame) <= max_points:
+        return frame
+
+    codes, groups = pd.factorize(frame[group])
+    xs, ys = numeric(frame[x]), numeric(frame[y])
+
+    if curve:
+        count = max(1, max_points // (2 * len(groups)))
+        keys = codes * count + buckets(xs, count)
+
+        # First and last of each bucket once sorted by y
+        order = np.lexsort((ys, keys))
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)] - 1
+        positions = np.union1d(order[starts], order[ends])
+
+    else:
+        cells = int(np.sqrt(max_points))
+        while True:
+            keys = (codes * cells + buckets(xs, cells)) * cells + buckets(ys, cells)
+            positions = np.sort(np.unique(keys, return_index=True)[1])
+            if len(positions) <= max_points or cells == 1:
+                break
+            cells = max(1, int(cells * np.sqrt(max_points / len(positions))))
+
+    return frame.iloc[positions]
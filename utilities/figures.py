@@ -1,7 +1,7 @@
 import plotly.graph_objects as go
 import plotly.express as px
+import numpy as np
 import pandas as pd
-import yaml
 import utilities
 
 #------------------------------------------------------------------------------------------------
@@ -10,62 +10,51 @@ def import_colors(
     language: str,
 ) -> dict:
 
-    with open('settings/color_settings.yaml') as file:
-        colors_settings = yaml.load(file, Loader=yaml.FullLoader)
-
-    translation = utilities.translation[scope]
-
-    return {translation[key][language]: colors_settings[scope][key] for key in colors_settings[scope]}
+    return utilities.settings.colors(scope, language)
 
 
 #------------------------------------------------------------------------------------------------------------
 def get_waypoints_overtime(
     places    : pd.DataFrame,
     activities: pd.DataFrame,
+    waypoints : pd.DataFrame,
 ) -> pd.DataFrame:
     '''
-    Merge Places and Activities to get waypoints per time period
+    Merge Places and Activities to get waypoints per time period: one row per (activity, visited place).
+    waypoints: (id, waypoint) pairs, see Dataset.waypoints. Cached per dataset, see Dataset.visits
     '''
 
-    df = activities[['date', 'waypoints']].dropna().rename(columns={'waypoints': 'waypoint'})
-    df1 = pd.DataFrame(df['waypoint'].str.split(', ').tolist(), index=df['date']).stack()
-    df1 = df1.reset_index([0, 'date'])
-    df1.columns = ['date', 'waypoint']
-    df1['year'] = df1['date'].str.split('-').str[0].astype(int)
+    df1 = activities[['id', 'date', 'year']].merge(waypoints, on='id')
 
-    activity_year = df1.merge(
-        places[['waypoint', 'category', 'category_translated', 'altitude', 'latitude', 'longitude']],
+    return df1.merge(
+        places[['waypoint', 'category', 'altitude', 'latitude', 'longitude']],
         how = 'left',
         on  = 'waypoint'
-    ).dropna()
-
-    return activity_year
+    ).dropna(subset=['category'])
 
 
 #------------------------------------------------------------------------------------------------
 def activities_yearly_summary(
-    activities: pd.DataFrame,
+    days      : pd.DataFrame,
     cumulative_activities,
     language  : str,
     height    = 800
 ) -> go.Figure:
     '''
-    Days in the mountain, over time and by activity category
+    Days in the mountain, over time and by activity category.
+    days: (year, category_translated, days), see YearlyAggregates.days_for
     '''    
 
-    if len(activities) == 0:
+    if len(days) == 0:
         return go.Figure()
 
     colors = import_colors('activities', language)
-    df = activities.sort_values(by='date').groupby(['year', 'category_translated'])['days'].sum().to_frame().reset_index()
+    df = days.groupby(['year', 'category_translated'])['days'].sum().to_frame().reset_index()
     df['year'] = df['year'].astype(int)
     
     if cumulative_activities:
         
         df['cumsum'] = df.groupby(['category_translated'])['days'].cumsum()
-        print(df)        
-        #df = activities.groupby(['year', 'category_translated']).last()
-        #print(df)
 
         fig = px.bar(
             df,
@@ -93,7 +82,7 @@ def activities_yearly_summary(
             yaxis   = dict(title=utilities.translation['activities_details']['days'][language]),
         )
 
-        df = activities.groupby(['year'])['days'].sum()
+        df = df.groupby(['year'])['days'].sum()
 
         for year, days in df.items():
 
@@ -109,18 +98,17 @@ def activities_yearly_summary(
 
 #------------------------------------------------------------------------------------------------
 def places_yearly_summary(
-    places    : pd.DataFrame,
-    activities: pd.DataFrame,
+    waypoints : pd.DataFrame,
     language  : str,
     height    = 800
 ) -> go.Figure:
     '''
-    Waypoints in the mountain, over time and by category
+    Waypoints in the mountain, over time and by category.
+    waypoints: (year, category_translated, waypoint count), see YearlyAggregates.waypoints_for
     '''
      
     colors = import_colors('places', language)
-    df = get_waypoints_overtime(places, activities)
-    df = pd.DataFrame(df.groupby(['year', 'category_translated'])['waypoint'].count()).reset_index()
+    df = waypoints.groupby(['year', 'category_translated'])['waypoint'].sum().reset_index()
 
     fig = go.Figure(
         data = [go.Bar
@@ -155,32 +143,20 @@ def places_yearly_summary(
 
 #------------------------------------------------------------------------------------------------
 def contexts_yearly_summary(
-    activities: pd.DataFrame,
+    contexts  : pd.DataFrame,
     language  : str,
     height    = 800
 ) -> go.Figure:
     '''
-    Create context evolution plot
+    Create context evolution plot.
+    contexts: (year, context, role, days) translated, see YearlyAggregates.contexts_for
     '''
 
-    if len(activities) == 0:
+    if len(contexts) == 0:
         return go.Figure()
 
-
-    context_map = utilities.translation['contexts']
-    context_map = {key: context_map[key][language] for key in context_map }
-    activities['context'] = activities['context'].map(context_map)
-
-    role_map = utilities.translation['roles']
-    role_map = {key: role_map[key][language] for key in role_map }
-
-    activities['role'] = activities['role'].map(role_map)
-    activities['role'].fillna('?', inplace=True)
-
-    df = pd.DataFrame(activities.groupby(['year', 'context', 'role' ])['days'].sum()).reset_index()
-
     context_fig = px.bar(
-        df,
+        contexts,
         x         = 'year',
         y         = 'days',
         color     = 'role',
@@ -215,24 +191,28 @@ def grades_overtime(
 
     for activity in colors.keys():
 
-        df = activities[activities['category_translated']==activity].sort_values(by='grade_num')
+        df = activities[activities['category_translated']==activity].sort_values(by='grade_num', kind='stable')
+
+        # Grades of that sport only, ordered by their numeric value (unknown grades last)
+        df = df.assign(grade=pd.Categorical(df['grade'].astype(object), categories=df['grade'].dropna().astype(object).unique(), ordered=True))
         
         fig = go.Figure(
             data = go.Scatter(
-                x            = df['date'],
-                y            = df['grade'],
+                x            = utilities.transport.serializable(df['date']),
+                y            = utilities.transport.serializable(df['grade']),
                 mode         = 'markers',
                 marker_color = colors[activity],
-                text         = df['label']
+                text         = utilities.transport.serializable(df['label'])
             )
         )
 
-        total = df.groupby('grade').count()
+        total = df.groupby('grade', observed=True).count()
         for idx, row in total.iterrows():
             fig.add_annotation(x=max(df['date']), y=idx, text=f"({row['days']})", showarrow=False, xshift=30 )
 
         fig.update_layout(
-            title=f'{activity} (' + str(len(df)) + ')'
+            title = f'{activity} (' + str(len(df)) + ')',
+            yaxis = dict(categoryorder='array', categoryarray=list(df['grade'].cat.categories)),
         )
 
         climb_by_grades[activity] = fig
@@ -245,8 +225,14 @@ def waypoints_by_altitude(
     places         : pd.DataFrame,
     altitude_range : list,
     categories     : list, 
-    language       : str
+    language       : str,
+    view           : dict = None,
+    max_points     : int  = None,
 ) -> go.Figure:
+    '''
+    Places sorted by altitude. Already sorted places (see Dataset.places_by_altitude) are not sorted again.
+    view: axis ranges zoomed in (see decimation.relayout_view), the points outside are not sent
+    '''
 
     colors = import_colors('places', language)
 
@@ -258,24 +244,30 @@ def waypoints_by_altitude(
     ]
 
     # Stats
-    df = df.sort_values('altitude').reset_index()
-    df['index'] = df.index
+    if not df['altitude'].is_monotonic_increasing:
+        df = df.sort_values('altitude', kind='stable')
+    df = df.assign(index=np.arange(len(df)))
+    trace = utilities.decimation.scatter(len(df))
+
+    df = utilities.decimation.within(df, 'index', 'altitude', view)
+    df = utilities.decimation.decimate(df, 'index', 'altitude', max_points, curve=True)
 
     fig = go.Figure(
-        data = [go.Scatter(
+        data = [trace(
             name         = category,
-            x            = df[df['category_translated']==category]['index'],
-            y            = df[df['category_translated']==category]['altitude'],
+            x            = utilities.transport.serializable(points['index']),
+            y            = utilities.transport.serializable(points['altitude']),
             mode         = 'markers',
-            text         = df[df['category_translated']==category]['waypoint'],
+            text         = utilities.transport.serializable(points['waypoint']),
             marker_color = colors[category])
 
-            for category in df['category_translated'].unique()
+            for category, points in df.groupby('category_translated', sort=False)
         ]
     )                            
 
     fig.update_layout(
-        yaxis=dict(title='Altitude')
+        yaxis      = dict(title='Altitude'),
+        uirevision = 'waypoints_by_altitude'
     )
     fig.update_xaxes(showticklabels=False)  
 
@@ -284,15 +276,19 @@ def waypoints_by_altitude(
 
 #------------------------------------------------------------------------------------------------
 def waypoints_by_year(
-    places         : pd.DataFrame,
-    activities     : pd.DataFrame,
-    altitude_range : list,
-    categories     : list,
-    language       : str,
-    height         = 800
+    waypoints_overtime : pd.DataFrame,
+    altitude_range     : list,
+    categories         : list,
+    language           : str,
+    height             = 800,
+    view               : dict = None,
+    max_points         : int  = None,
 ) -> go.Figure:
+    '''
+    waypoints_overtime: see get_waypoints_overtime
+    view: axis ranges zoomed in (see decimation.relayout_view), the points outside are not sent
+    '''
 
-    waypoints_overtime = get_waypoints_overtime(places, activities)
     colors = import_colors('places', language)
 
     filtered_places = waypoints_overtime[
@@ -300,24 +296,29 @@ def waypoints_by_year(
         (waypoints_overtime['altitude'] <= altitude_range[1]) & 
         (waypoints_overtime['category'].isin(categories))
     ]
+    trace = utilities.decimation.scatter(len(filtered_places))
+
+    filtered_places = utilities.decimation.within(filtered_places, 'date', 'altitude', view)
+    filtered_places = utilities.decimation.decimate(filtered_places, 'date', 'altitude', max_points)
     
     figure = go.Figure(
-        data = [ go.Scatter(
+        data = [trace(
             name         = category,
-            x            = filtered_places[filtered_places['category_translated']==category]['date'],
-            y            = filtered_places[filtered_places['category_translated']==category]['altitude'],
+            x            = utilities.transport.serializable(points['date']),
+            y            = utilities.transport.serializable(points['altitude']),
             mode         = 'markers',
-            text         = filtered_places[filtered_places['category_translated']==category]['waypoint'],
+            text         = utilities.transport.serializable(points['waypoint']),
             marker_color = colors[category])
 
-            for category in filtered_places['category_translated'].unique()
+            for category, points in filtered_places.groupby('category_translated', sort=False)
         ]
     )
 
     figure.update_layout(
-        yaxis    = dict(title='Altitude'),
-        autosize = False,
-        height   = height)
+        yaxis      = dict(title='Altitude'),
+        autosize   = False,
+        height     = height,
+        uirevision = 'waypoints_by_year')
 
     return figure
 
@@ -332,6 +333,9 @@ def create_map(
     altitude_range  = None,
     categories      = None,
     zoom            = 8,    
+    center          = None,
+    uirevision      = None,
+    clustered       = False,
 ) -> px.scatter_mapbox:
 
     # User searched for that place, let's focus on it
@@ -351,6 +355,11 @@ def create_map(
         if altitude_range != altitude_values:
             all_places = all_places[ all_places['altitude'].between(altitude_values[0], altitude_values[1], inclusive='both')]
 
+    # Clusters (see PlaceIndex.clusters): sized by count, named after their content
+    if clustered:
+        label = all_places['count'].astype(str) + ' x ' + all_places['category_translated']
+        all_places = all_places.assign(waypoint=all_places['waypoint'].fillna(label))
+
     waypoint_category_colors = import_colors('places', language)
     
     map_figure = px.scatter_mapbox(
@@ -360,8 +369,11 @@ def create_map(
         color                   = 'category_translated',
         color_discrete_map      = {category: waypoint_category_colors[category] for category in waypoint_category_colors},
         hover_name              = "waypoint",
-        hover_data              = ['altitude'],
+        hover_data              = ['altitude', 'count'] if clustered else ['altitude'],
+        size                    = 'count' if clustered else None,
+        size_max                = 30,
         zoom                    = zoom,
+        center                  = center,
         height                  = height
     )
 
@@ -375,6 +387,10 @@ def create_map(
     map_figure.update_layout(
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
         legend_title = "",
+        uirevision   = uirevision,
     )
 
+    if clustered:
+        map_figure.update_traces(marker_sizemin=6)
+
     return map_figure
\ No newline at end of file
@@ -0,0 +1,251 @@
+import cProfile
+import functools
+import hmac
+import os
+import threading
+import time
+from collections import defaultdict, deque
+import flask
+import numpy as np
+from dash.exceptions import PreventUpdate
+import utilities
+
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+#------------------------------------------------------------------------------------------------------------
+class Metrics:
+    '''
+    Timings of instrumented calls, keyed by (kind, name): call count, total duration, the durations of the
+    last calls (window) for the percentiles, and payload bytes
+    '''
+
+    def __init__(
+        self,
+        window = 1024
+    ):
+        self.window = window
+        self.durations = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        key     : tuple,
+        duration: float,
+        error   = False,
+        **sizes
+    ):
+        '''
+        sizes: payload bytes by direction, e.g. request=..., response=...
+        '''
+
+        with self.lock:
+            self.durations[key].append(duration)
+            self.counts[key] += 1
+            self.seconds[key] += duration
+            self.errors[key] += error
+            for direction, size in sizes.items():
+                if size is not None:
+                    self.bytes[key + (direction,)] += size
+
+    def prometheus(self) -> str:
+        '''
+        All metrics in Prometheus text format, figure cache included
+        '''
+
+        def labels(**values):
+            return '{' + ','.join(f'{label}="{value}"' for label, value in values.items()) + '}'
+
+        lines = [
+            '# HELP mountain_goats_seconds Duration of the callbacks and figure builders',
+            '# TYPE mountain_goats_seconds summary',
+        ]
+
+        with self.lock:
+            durations = {key: np.array(values) for key, values in self.durations.items()}
+            counts, seconds, errors, sizes = dict(self.counts), dict(self.seconds), dict(self.errors), dict(self.bytes)
+
+        for (kind, name), values in sorted(durations.items()):
+            for quantile, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+                lines.append(f'mountain_goats_seconds{labels(kind=kind, name=name, quantile=quantile)} {value:.6f}')
+            lines.append(f'mountain_goats_seconds_sum{labels(kind=kind, name=name)} {seconds[(kind, name)]:.6f}')
+            lines.append(f'mountain_goats_seconds_count{labels(kind=kind, name=name)} {counts[(kind, name)]}')
+
+        lines += [
+            '# HELP mountain_goats_errors_total Calls that raised (PreventUpdate excluded)',
+            '# TYPE mountain_goats_errors_total counter',
+        ]
+        for (kind, name), value in sorted(errors.items()):
+            lines.append(f'mountain_goats_errors_total{labels(kind=kind, name=name)} {value}')
+
+        lines += [
+            '# HELP mountain_goats_payload_bytes_total Bytes received and sent by the callbacks, built by the figure builders',
+            '# TYPE mountain_goats_payload_bytes_total counter',
+        ]
+        for (kind, name, direction), value in sorted(sizes.items()):
+            lines.append(f'mountain_goats_payload_bytes_total{labels(kind=kind, name=name, direction=direction)} {value}')
+
+        cache = utilities.figure_cache
+        with cache.lock:
+            hits, misses = dict(cache.hits), dict(cache.misses)
+
+        lines += [
+            '# HELP mountain_goats_figure_cache_requests_total Figure cache lookups, by name and result',
+            '# TYPE mountain_goats_figure_cache_requests_total counter',
+        ]
+        for result, values in [('hit', hits), ('miss', misses)]:
+            for name, value in sorted(values.items()):
+                lines.append(f'mountain_goats_figure_cache_requests_total{labels(name=name, result=result)} {value}')
+
+        stats = cache.stats()
+        lines += [
+            '# TYPE mountain_goats_figure_cache_entries gauge',
+            f"mountain_goats_figure_cache_entries {stats['entries']}",
+            '# TYPE mountain_goats_figure_cache_bytes gauge',
+            f"mountain_goats_figure_cache_bytes {stats['bytes']}",
+            '# TYPE mountain_goats_figure_cache_evictions_total counter',
+            f"mountain_goats_figure_cache_evictions_total {stats['evictions']}",
+        ]
+
+        return '\n'.join(lines) + '\n'
+
+
+#------------------------------------------------------------------------------------------------------------
+class Profiler:
+    '''
+    cProfile of each call, kept (as a .prof file, see pstats / snakeviz) only when the call took more
+    than threshold seconds. At most max_files are kept, the oldest are removed.
+    One call is profiled at a time: concurrent calls run without profiler.
+    '''
+
+    def __init__(
+        self,
+        threshold : float,
+        directory = 'profiles',
+        max_files = 100,
+    ):
+        self.threshold = threshold
+        self.directory = directory
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def run(
+        self,
+        name: str,
+        call,
+    ):
+        if not self.lock.acquire(blocking=False):
+            return call()
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+
+        try:
+            return profile.runcall(call)
+
+        finally:
+            duration = time.perf_counter() - start
+            if duration > self.threshold:
+                file = f"{time.strftime('%Y%m%d-%H%M%S')}-{name.replace(':', '.')}-{int(duration * 1000)}ms.prof"
+                profile.dump_stats(os.path.join(self.directory, file))
+                self.clean()
+            self.lock.release()
+
+    def clean(self):
+
+        files = sorted(os.listdir(self.directory), key=lambda file: os.path.getmtime(os.path.join(self.directory, file)))
+        for file in files[:-self.max_files]:
+            os.remove(os.path.join(self.directory, file))
+
+
+#------------------------------------------------------------------------------------------------------------
+def timed(
+    function,
+    key     : tuple,
+    payload = None,
+    profiler: Profiler = None,
+):
+    '''
+    function, recording its duration under key (and the size of its result with payload)
+    '''
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+
+        start = time.perf_counter()
+
+        try:
+            if profiler:
+                result = profiler.run(key[1], lambda: function(*args, **kwargs))
+            else:
+                result = function(*args, **kwargs)
+        except PreventUpdate:
+            metrics.record(key, time.perf_counter() - start)
+            raise
+        except Exception:
+            metrics.record(key, time.perf_counter() - start, error=True)
+            raise
+
+        duration = time.perf_counter() - start
+        metrics.record(key, duration, **(payload(result) if payload else {}))
+
+        return result
+
+    return wrapper
+
+
+def instrument(
+    app,
+    profile_threshold = None,
+    profile_directory = 'profiles',
+    token             = None,
+):
+    '''
+    Opt-in instrumentation of a Dash app, once all callbacks are registered: every server-side callback
+    and figure builder is timed, slow callbacks are profiled (when profile_threshold is set, in seconds),
+    and aggregated metrics are served on /metrics when a token is given, to requests bearing it
+    (Authorization: Bearer <token>). The client address cannot tell: behind a proxy, all are local.
+    '''
+
+    profiler = profile_threshold and Profiler(profile_threshold, profile_directory)
+
+    # Server-side callbacks: Dash calls the registered wrapper, which returns the serialized response
+    for output, callback in app.callback_map.items():
+        if 'callback' not in callback:
+            continue
+        function = callback['callback']
+        name = f"{function.__name__}:{output.strip('.').split('...')[0]}"
+        callback['callback'] = timed(
+            function,
+            ('callback', name),
+            lambda response: {'request': flask.request.content_length, 'response': len(response)},
+            profiler
+        )
+
+    # Figure builders, called as utilities.<name>
+    for name in dir(utilities.figures):
+        function = getattr(utilities.figures, name)
+        if callable(function) and getattr(function, '__module__', None) == 'utilities.figures':
+            wrapped = timed(function, ('figure', name), lambda figure: {'built': utilities.cache.estimate_size(figure)})
+            setattr(utilities.figures, name, wrapped)
+            setattr(utilities, name, wrapped)
+
+    if not token:
+        return
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+
+        if not hmac.compare_digest(flask.request.headers.get('Authorization', ''), f'Bearer {token}'):
+            flask.abort(401)
+
+        return flask.Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
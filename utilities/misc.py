@@ -1,16 +1,101 @@
+import json
+import os
 import pandas as pd
 import utilities
 
 #------------------------------------------------------------------------------------------------------------
-def apply_numeric_grading(row, grades):
+def grade_scale(
+    grades: dict
+) -> pd.DataFrame:
+    '''
+    Flattened (category, grade) -> grade_num lookup from metadata['activity'], grades of each category
+    in ascending order
+    '''
 
-    activity = row['category']
-    grade = row['grade']
+    scale = pd.DataFrame(
+        [(category, grade, value) for category, activity in grades.items() for grade, value in (activity.get('grades') or {}).items()],
+        columns = ['category', 'grade', 'grade_num']
+    )
+    scale['grade_num'] = pd.to_numeric(scale['grade_num'], errors='coerce').astype(float)
 
-    try: 
-        return grades[activity]['grades'][grade]
-    except:
-        return grade
+    return scale.sort_values(['category', 'grade_num'], kind='stable', ignore_index=True)
+
+
+def numeric_grades(
+    activities: pd.DataFrame,
+    grades    : dict
+) -> pd.Series:
+    '''
+    grade_num of each activity, NaN when the grade is unknown for its category
+    '''
+
+    scale = grade_scale(grades).set_index(['category', 'grade'])['grade_num']
+    keys = pd.MultiIndex.from_arrays([activities['category'].astype(object), activities['grade'].astype(object)])
+
+    return pd.Series(scale.reindex(keys).to_numpy(dtype=float), index=activities.index)
+
+
+#------------------------------------------------------------------------------------------------------------
+def read_journal(
+    paths: list
+) -> dict:
+    '''
+    Upserts recorded in journal files (json lines), per table and in order.
+    A truncated last line (crash while writing) is ignored, any other unreadable line raises ValueError.
+    '''
+
+    rows = {'places': [], 'activities': []}
+
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+
+        with open(path) as file:
+            lines = file.readlines()
+
+        for number, line in enumerate(lines, 1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if number == len(lines) and not line.endswith('\n'):
+                    break
+                raise ValueError(f'{path}, line {number}: corrupted journal entry')
+            rows[entry['table']].append(entry['row'])
+
+    return rows
+
+
+def drop_torn_line(
+    path: str
+):
+    '''
+    Remove a truncated last line from a journal (crash while writing), so that the next entry starts on
+    a line of its own
+    '''
+
+    try:
+        with open(path, 'rb+') as file:
+            end = file.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            file.seek(end - 1)
+            if file.read(1) == b'\n':
+                return
+
+            # Back to the last complete line
+            position = end
+            while position > 0:
+                start = max(position - 4096, 0)
+                file.seek(start)
+                newline = file.read(position - start).rfind(b'\n')
+                if newline >= 0:
+                    file.truncate(start + newline + 1)
+                    return
+                position = start
+            file.truncate(0)
+
+    except FileNotFoundError:
+        pass
 
 
 #------------------------------------------------------------------------------------------------------------
@@ -18,30 +103,26 @@ def load_data(
     metadata   : dict,
     activities = 'data_activities.json',
     places     = 'data_places.json',
-) -> tuple: # of dicts
+    journals   = (),
+) -> utilities.Dataset:
     '''
-    Load Places and Activities from json files. Returns dicts.
+    Load Places and Activities from json files, then replay the saves recorded in the journals
+    since the files were written. Returns a Dataset.
     '''
     
     try: 
-        places = pd.read_json(places, orient='table').set_index('waypoint').to_dict('index')
+        places = pd.read_json(places, orient='table')
     except Exception as error:
         print('Error in load_data: ', repr(error))
-        places = {}
+        places = pd.DataFrame(columns=utilities.dataset.PLACES_COLUMNS)
 
     try:
         activities = pd.read_json(activities, orient='table')
-        activities = utilities.massage_activity_data(activities, metadata['activity'])
-        activities = activities.set_index('id').to_dict('index')
-
     except Exception as error:
         print('Error in load_data: ', repr(error))
-        activities = {}
+        activities = pd.DataFrame(columns=utilities.dataset.ACTIVITIES_COLUMNS)
 
-    return (
-        places,
-        activities
-    )
+    return utilities.Dataset.from_frames(places, activities, metadata).replay(read_journal(journals))
 
 
 #------------------------------------------------------------------------------------------------------------
@@ -50,21 +131,8 @@ def massage_activity_data(
     grades    : dict
 ) -> pd.DataFrame:
 
-    activities['grade_num'] = activities.apply(apply_numeric_grading, grades=grades, axis=1)
+    activities['grade_num'] = numeric_grades(activities, grades)
     activities['date'] = activities['date'].astype('str')
     activities['year'] = activities['date'].str.split('-').str[0].astype(int)
     
     return activities
-
-#------------------------------------------------------------------------------------------------------------
-def places_dict_to_df(
-    places: dict
-) -> pd.DataFrame:
-    
-    return pd.DataFrame.from_dict(places, orient='index').reset_index().rename(columns={'index': 'waypoint'})
-
-def activities_dict_to_df(
-    activities: dict
-) -> pd.DataFrame:
-    
-    return pd.DataFrame.from_dict(activities, orient='index').reset_index().rename(columns={'index': 'id'})
@@ -0,0 +1,75 @@
+import hashlib
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+from dash import Patch, no_update
+
+
+#------------------------------------------------------------------------------------------------------------
+def digest(
+    value
+) -> str:
+    return hashlib.md5(to_json_plotly(value).encode()).hexdigest()[:12]
+
+
+#------------------------------------------------------------------------------------------------------------
+def figure_digest(
+    figure: go.Figure
+) -> dict:
+    '''
+    Short hash of each trace, each annotation and each other layout key: what the browser holds,
+    without sending the figure back
+    '''
+
+    figure = figure.to_plotly_json()
+    layout = dict(figure['layout'])
+    annotations = layout.pop('annotations', [])
+
+    return {
+        'data'       : [digest(trace) for trace in figure['data']],
+        'annotations': [digest(annotation) for annotation in annotations],
+        'layout'     : {key: digest(value) for key, value in layout.items()},
+    }
+
+
+def figure_patch(
+    figure  : go.Figure,
+    new     : dict,
+    rendered: dict,
+):
+    '''
+    Partial update turning the rendered figure (known by its digest) into this one: only the traces
+    and annotations that changed are sent, layout keys it no longer has are deleted. Full figure when
+    the structure changed.
+    '''
+
+    if figure is None or not rendered or len(rendered['data']) != len(new['data']):
+        return figure
+
+    if rendered == new:
+        return no_update
+
+    figure = figure.to_plotly_json()
+    patch = Patch()
+
+    for position, (before, after) in enumerate(zip(rendered['data'], new['data'])):
+        if before != after:
+            patch['data'][position] = figure['data'][position]
+
+    annotations = figure['layout'].get('annotations', [])
+    if len(rendered['annotations']) != len(new['annotations']):
+        patch['layout']['annotations'] = annotations
+    else:
+        for position, (before, after) in enumerate(zip(rendered['annotations'], new['annotations'])):
+            if before != after:
+                patch['layout']['annotations'][position] = annotations[position]
+
+    for key, value in new['layout'].items():
+        if rendered['layout'].get(key) != value:
+            patch['layout'][key] = figure['layout'][key]
+
+    # e.g. axis settings of another chart shown in the same graph
+    for key in rendered['layout'].keys() - new['layout'].keys():
+        del patch['layout'][key]
+
+    return patch
+
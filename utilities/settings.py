@@ -0,0 +1,114 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import yaml
+import utilities
+
+
+LANGUAGES = list(utilities.translation['filter_buttons'])
+
+
+#------------------------------------------------------------------------------------------------------------
+class Settings:
+    '''
+    YAML settings loaded once, with translated lookup tables precomputed for every language.
+    With reload=True (local mode), files are re-read when their mtime changes.
+    '''
+
+    def __init__(
+        self,
+        directory = 'settings',
+        reload    = False
+    ):
+        self.directory = directory
+        self.reload = reload
+        self.mtimes = None
+        self.lock = threading.Lock()
+
+    def paths(self) -> dict:
+        return {
+            'colors'  : os.path.join(self.directory, 'color_settings.yaml'),
+            'metadata': os.path.join(self.directory, 'metadata.yaml'),
+        }
+
+    def refresh(self):
+
+        if self.mtimes is not None and not self.reload:
+            return
+
+        mtimes = {name: os.path.getmtime(path) for name, path in self.paths().items()}
+        if mtimes == self.mtimes:
+            return
+
+        with self.lock:
+            if mtimes == self.mtimes:
+                return
+
+            loaded = {}
+            for name, path in self.paths().items():
+                with open(path) as file:
+                    loaded[name] = yaml.load(file, Loader=yaml.FullLoader)
+
+            translation_maps = {
+                (scope, language): {key: labels[language] for key, labels in utilities.translation[scope].items()}
+                for scope in ['places', 'activities', 'contexts', 'roles']
+                for language in LANGUAGES
+            }
+
+            colors = {
+                (scope, language): {translation_maps[(scope, language)][key]: color for key, color in loaded['colors'][scope].items()}
+                for scope in ['places', 'activities']
+                for language in LANGUAGES
+            }
+
+            self._metadata = loaded['metadata']
+            self._translation_maps = translation_maps
+            self._colors = colors
+            self.mtimes = mtimes
+
+    @property
+    def metadata(self) -> dict:
+        self.refresh()
+        return self._metadata
+
+    def colors(
+        self,
+        scope   : str,
+        language: str,
+    ) -> dict:
+        '''
+        Translated label -> color. Shared, do not modify.
+        '''
+        self.refresh()
+        return self._colors[(scope, language)]
+
+    def translation_map(
+        self,
+        scope   : str,
+        language: str,
+    ) -> dict:
+        '''
+        Key -> translated label. Shared, do not modify.
+        '''
+        self.refresh()
+        return self._translation_maps[(scope, language)]
+
+    def translate(
+        self,
+        values  : pd.Series,
+        scope   : str,
+        language: str,
+    ) -> pd.Series:
+        '''
+        Translate a categorical column by mapping its codes: one lookup per category, not per row
+        '''
+
+        mapping = self.translation_map(scope, language)
+        labels = np.array([mapping.get(category, np.nan) for category in values.cat.categories] + [np.nan], dtype=object)
+
+        # code -1 (missing) picks the trailing NaN
+        return pd.Series(labels[values.cat.codes.to_numpy()], index=values.index, name=values.name)
+
+
+settings = Settings()
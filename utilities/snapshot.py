@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+import utilities
+
+
+FORMAT = 1
+TABLES = ['places', 'activities', 'waypoints']
+SEPARATOR = '\x00'  # between the strings of the dictionary
+
+
+#------------------------------------------------------------------------------------------------------------
+def sources_state(
+    paths: list
+) -> dict:
+    '''
+    (mtime, size) of each source file, None when missing
+    '''
+
+    state = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            state[path] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            state[path] = None
+
+    return state
+
+
+def typing_fingerprint(
+    metadata: dict
+) -> str:
+    '''
+    What typed frames depend on besides the data: metadata (grades) and known categories
+    '''
+
+    known = {scope: list(utilities.translation[scope]) for scope in ['places', 'activities', 'contexts', 'roles']}
+
+    return hashlib.md5(json.dumps([metadata, known], sort_keys=True, default=str).encode()).hexdigest()
+
+
+#------------------------------------------------------------------------------------------------------------
+def write(
+    dataset  : utilities.Dataset,
+    directory: str,
+    sources  : dict,
+):
+    '''
+    Snapshot of the dataset frames, as read from the sources (see sources_state): one .npy file per column,
+    categorical columns as codes, string columns as codes into one dictionary of all strings (NUL separated).
+    Files go to a new generation folder, the manifest is switched to it last: readers see either snapshot.
+    '''
+
+    generation = uuid.uuid4().hex[:8]
+    folder = os.path.join(directory, generation)
+
+    try:
+        os.makedirs(folder)
+        tables, strings = {}, []
+
+        frames = {'places': dataset.places, 'activities': dataset.activities, 'waypoints': dataset.waypoints}
+        for table, frame in frames.items():
+            columns = []
+            np.save(os.path.join(folder, f'{table}.index.npy'), frame.index.to_numpy(dtype=np.int64))
+
+            for name, values in frame.items():
+                path = os.path.join(folder, f'{table}.{name}.npy')
+
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    np.save(path, values.cat.codes.to_numpy())
+                    columns.append([name, {'kind': 'category', 'categories': values.cat.categories.tolist()}])
+
+                elif values.dtype == object:
+                    if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+                        raise ValueError(f'{table}.{name}: only strings can be snapshotted')
+                    missing = values.isna().to_numpy()
+                    strings.append((path, missing, values.to_numpy()[~missing]))
+                    first = values[missing].iloc[0] if missing.any() else None
+                    columns.append([name, {'kind': 'string', 'missing': 'none' if first is None else 'nan'}])
+
+                else:
+                    np.save(path, values.to_numpy())
+                    columns.append([name, {'kind': 'array'}])
+
+            tables[table] = {'rows': len(frame), 'columns': columns}
+
+        # One dictionary for all string columns: waypoint names appear in several
+        dictionary = pd.unique(np.concatenate([present for _, _, present in strings] + [np.array([], dtype=object)]))
+        if any(SEPARATOR in value for value in dictionary):
+            raise ValueError('strings containing NUL cannot be snapshotted')
+        lookup = pd.Index(dictionary)
+        for path, missing, present in strings:
+            codes = np.full(len(missing), -1, dtype=np.int32)
+            codes[~missing] = lookup.get_indexer(present)
+            np.save(path, codes)
+
+        with open(os.path.join(folder, 'strings.txt'), 'w', encoding='utf-8') as file:
+            file.write(SEPARATOR.join(dictionary))
+
+        manifest = {
+            'format'     : FORMAT,
+            'generation' : generation,
+            'sources'    : sources,
+            'fingerprint': typing_fingerprint(dataset.metadata),
+            'strings'    : len(dictionary),
+            'tables'     : tables,
+        }
+
+        path = os.path.join(directory, 'manifest.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(manifest, file)
+        os.replace(path + '.tmp', path)
+
+    except (OSError, ValueError) as error:
+        print('Error in snapshot.write: ', repr(error))
+        shutil.rmtree(folder, ignore_errors=True)
+        return
+
+    # Previous generations: processes that mapped them keep their pages until they let go
+    for entry in os.listdir(directory):
+        if entry != generation and os.path.isdir(os.path.join(directory, entry)):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+def read(
+    directory: str,
+    sources  : list,
+    metadata : dict,
+) -> utilities.Dataset:
+    '''
+    Dataset from the snapshot, numeric columns memory-mapped (pages shared by all workers through the
+    OS cache). None when there is no snapshot, or when the sources or the metadata changed since.
+    '''
+
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if (
+        manifest.get('format') != FORMAT or
+        manifest['sources'] != sources_state(sources) or
+        manifest['fingerprint'] != typing_fingerprint(metadata)
+    ):
+        return None
+
+    folder = os.path.join(directory, manifest['generation'])
+
+    try:
+        with open(os.path.join(folder, 'strings.txt'), encoding='utf-8') as file:
+            text = file.read()
+        dictionary = text.split(SEPARATOR) if manifest['strings'] else []
+
+        # Code -1 (missing) picks the trailing value
+        lookups = {
+            missing: np.array(dictionary + [value], dtype=object)
+            for missing, value in [('none', None), ('nan', np.nan)]
+        }
+
+        frames = {}
+        for table in TABLES:
+            columns = {}
+            for name, spec in manifest['tables'][table]['columns']:
+                array = np.load(os.path.join(folder, f'{table}.{name}.npy'), mmap_mode='r')
+                if spec['kind'] == 'category':
+                    columns[name] = pd.Categorical.from_codes(array, spec['categories'])
+                elif spec['kind'] == 'string':
+                    columns[name] = lookups[spec['missing']][array]
+                else:
+                    columns[name] = array
+
+            index = pd.Index(np.load(os.path.join(folder, f'{table}.index.npy'), mmap_mode='r'))
+            frames[table] = pd.DataFrame(columns, index=index, copy=False)
+
+    except (OSError, ValueError, KeyError) as error:
+        print('Error in snapshot.read: ', repr(error))
+        return None
+
+    return utilities.Dataset(frames['places'], frames['activities'], frames['waypoints'], metadata)
@@ -0,0 +1,284 @@
+import math
+import numpy as np
+import pandas as pd
+
+
+WORLD_TILE = 256  # pixels of the whole world at zoom 0
+CELL_OFFSET = 1 << 20
+
+CLUSTER_PIXELS = 48     # places closer than that on screen are merged
+CLUSTER_MAX_ZOOM = 11   # from that zoom on, every place is shown
+
+
+#------------------------------------------------------------------------------------------------------------
+def cluster_level(
+    zoom: float
+) -> int:
+    '''
+    Clustering level of a zoom, CLUSTER_MAX_ZOOM meaning no clustering
+    '''
+
+    return int(min(max(math.floor(zoom), 0), CLUSTER_MAX_ZOOM))
+
+
+def cluster_cell_size(
+    level: int
+) -> float:
+    '''
+    Grid step in degrees at that level, each level doubles the previous one
+    '''
+
+    return CLUSTER_PIXELS * 360 / (WORLD_TILE * 2 ** level)
+
+
+#------------------------------------------------------------------------------------------------------------
+def aggregate_cells(
+    cells: pd.DataFrame
+) -> pd.DataFrame:
+    '''
+    Merge the rows falling in the same (lat_cell, lon_cell). row is kept for clusters of a single place.
+    '''
+
+    return cells.groupby(['lat_cell', 'lon_cell'], sort=False).agg(
+        count    = ('count',    'sum'),
+        lat_sum  = ('lat_sum',  'sum'),
+        lon_sum  = ('lon_sum',  'sum'),
+        altitude = ('altitude', 'max'),
+        row      = ('row',      'min'),
+    ).reset_index()
+
+
+def point_cells(
+    places: pd.DataFrame,
+    rows  : np.ndarray,
+    level : int,
+) -> pd.DataFrame:
+
+    cell = cluster_cell_size(level)
+    latitudes = places['latitude'].to_numpy()[rows]
+    longitudes = places['longitude'].to_numpy()[rows]
+
+    return pd.DataFrame({
+        'lat_cell': np.floor(latitudes / cell).astype(np.int64),
+        'lon_cell': np.floor(longitudes / cell).astype(np.int64),
+        'count'   : 1,
+        'lat_sum' : latitudes,
+        'lon_sum' : longitudes,
+        'altitude': places['altitude'].to_numpy()[rows],
+        'row'     : rows,
+    })
+
+
+def cluster_levels(
+    places: pd.DataFrame,
+    rows  : np.ndarray,
+) -> dict:
+    '''
+    Clusters of these places at every level: finest grid first, each coarser level merges 2x2 cells
+    '''
+
+    levels = {}
+    cells = point_cells(places, rows, CLUSTER_MAX_ZOOM - 1)
+
+    for level in range(CLUSTER_MAX_ZOOM - 1, -1, -1):
+        levels[level] = aggregate_cells(cells)
+        cells = levels[level].assign(lat_cell=levels[level]['lat_cell'] // 2, lon_cell=levels[level]['lon_cell'] // 2)
+
+    return levels
+
+
+#------------------------------------------------------------------------------------------------------------
+class PlaceIndex:
+    '''
+    Spatial grid over latitude/longitude, plus places partitioned by category and sorted by altitude.
+    Queries return row positions in the places frame.
+    '''
+
+    def __init__(
+        self,
+        places   : pd.DataFrame,
+        cell_size= 0.05
+    ):
+        self.cell_size = cell_size
+        self.size = len(places)
+        self.places = places[['waypoint', 'latitude', 'longitude', 'altitude']]
+
+        # Grid: rows sorted by cell, one slice per non-empty cell
+        lat_cells = np.floor(places['latitude'].to_numpy() / cell_size).astype(np.int64)
+        lon_cells = np.floor(places['longitude'].to_numpy() / cell_size).astype(np.int64)
+        keys = (lat_cells + CELL_OFFSET) * (2 * CELL_OFFSET) + (lon_cells + CELL_OFFSET)
+
+        self.rows = np.argsort(keys, kind='stable')
+        cells, self.starts = np.unique(keys[self.rows], return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys))
+        self.cell_lat = cells // (2 * CELL_OFFSET) - CELL_OFFSET
+        self.cell_lon = cells % (2 * CELL_OFFSET) - CELL_OFFSET
+
+        # Category partitions, each sorted by altitude
+        altitudes = places['altitude'].to_numpy()
+        self.by_category = {}
+        for category, rows in places.groupby('category', observed=True).indices.items():
+            rows = rows[np.argsort(altitudes[rows], kind='stable')]
+            self.by_category[category] = (rows, altitudes[rows])
+
+        # Clusters of each category at every zoom level
+        self.clusters_by_category = {
+            category: cluster_levels(self.places, rows)
+            for category, (rows, _) in self.by_category.items()
+        }
+
+    def within(
+        self,
+        bounds: tuple
+    ) -> np.ndarray:
+        '''
+        Rows in the cells overlapping (lat_min, lat_max, lon_min, lon_max)
+        '''
+
+        lat_min, lat_max, lon_min, lon_max = bounds
+        cells = np.flatnonzero(
+            (self.cell_lat >= math.floor(lat_min / self.cell_size)) &
+            (self.cell_lat <= math.floor(lat_max / self.cell_size)) &
+            (self.cell_lon >= math.floor(lon_min / self.cell_size)) &
+            (self.cell_lon <= math.floor(lon_max / self.cell_size))
+        )
+
+        if len(cells) == 0:
+            return np.array([], dtype=np.int64)
+
+        return np.concatenate([self.rows[self.starts[cell]:self.ends[cell]] for cell in cells])
+
+    def select(
+        self,
+        categories = None,
+        altitude   = None,
+    ) -> np.ndarray:
+        '''
+        Rows of these categories (all if None) within the altitude range (all if None)
+        '''
+
+        selected = []
+        for category, (rows, altitudes) in self.by_category.items():
+            if categories is not None and category not in categories:
+                continue
+            if altitude is not None:
+                rows = rows[np.searchsorted(altitudes, altitude[0], 'left'):np.searchsorted(altitudes, altitude[1], 'right')]
+            selected.append(rows)
+
+        if not selected:
+            return np.array([], dtype=np.int64)
+
+        return np.concatenate(selected)
+
+    def clusters(
+        self,
+        level     : int,
+        categories = None,
+        altitude   = None,
+        bounds     = None,
+    ) -> pd.DataFrame:
+        '''
+        Clusters of places per category, at most one per grid cell of that level: category, waypoint
+        (None for a cluster of several places), latitude, longitude, max altitude and count.
+        Precomputed levels are used unless an altitude range is applied.
+        '''
+
+        frames = []
+        for category in self.by_category:
+            if categories is not None and category not in categories:
+                continue
+
+            if altitude is None:
+                cells = self.clusters_by_category[category][level]
+            else:
+                cells = aggregate_cells(point_cells(self.places, self.select([category], altitude), level))
+
+            frames.append(cells.assign(category=category))
+
+        if not frames:
+            return pd.DataFrame(columns=['category', 'waypoint', 'latitude', 'longitude', 'altitude', 'count'])
+
+        clusters = pd.concat(frames, ignore_index=True)
+        clusters['latitude'] = clusters['lat_sum'] / clusters['count']
+        clusters['longitude'] = clusters['lon_sum'] / clusters['count']
+
+        if bounds is not None:
+            clusters = clusters[
+                clusters['latitude'].between(bounds[0], bounds[1]) &
+                clusters['longitude'].between(bounds[2], bounds[3])
+            ]
+
+        names = self.places['waypoint'].to_numpy()[clusters['row'].to_numpy()]
+        clusters = clusters.assign(waypoint=np.where(clusters['count']==1, names, None))
+
+        return clusters[['category', 'waypoint', 'latitude', 'longitude', 'altitude', 'count']].reset_index(drop=True)
+
+
+#------------------------------------------------------------------------------------------------------------
+def view_bounds(
+    center: dict,
+    zoom  : float,
+    width = 1600,
+    height= 800,
+) -> tuple:
+    '''
+    Approximate (lat_min, lat_max, lon_min, lon_max) shown by a web mercator map
+    '''
+
+    degrees_per_pixel = 360 / (WORLD_TILE * 2 ** zoom)
+    lon_span = width * degrees_per_pixel / 2
+    lat_span = height * degrees_per_pixel * math.cos(math.radians(center['lat'])) / 2
+
+    return (center['lat'] - lat_span, center['lat'] + lat_span, center['lon'] - lon_span, center['lon'] + lon_span)
+
+
+#------------------------------------------------------------------------------------------------------------
+def relayout_view(
+    relayout: dict
+):
+    '''
+    (bounds, zoom) from the map relayoutData, None if the event is not a pan/zoom
+    '''
+
+    if not relayout or 'mapbox.zoom' not in relayout:
+        return None
+
+    zoom = relayout['mapbox.zoom']
+
+    try:
+        coordinates = relayout['mapbox._derived']['coordinates']
+        lons = [point[0] for point in coordinates]
+        lats = [point[1] for point in coordinates]
+        bounds = (min(lats), max(lats), min(lons), max(lons))
+    except (KeyError, TypeError):
+        bounds = view_bounds(relayout['mapbox.center'], zoom)
+
+    return (bounds, zoom)
+
+
+#------------------------------------------------------------------------------------------------------------
+def padded_bounds(
+    bounds: tuple,
+    margin= 0.5
+) -> list:
+    '''
+    Bounds grown by at least margin x the view span on each side, snapped to a grid so that
+    small pans give the same result
+    '''
+
+    lat_min, lat_max, lon_min, lon_max = bounds
+    step = 2.0 ** math.ceil(math.log2(max(lat_max - lat_min, lon_max - lon_min, 1e-6) * margin))
+
+    return [
+        (math.floor(lat_min / step) - 1) * step,
+        (math.ceil(lat_max / step) + 1) * step,
+        (math.floor(lon_min / step) - 1) * step,
+        (math.ceil(lon_max / step) + 1) * step,
+    ]
+
+
+def contains(
+    outer: list,
+    inner: tuple
+) -> bool:
+    return outer[0] <= inner[0] and inner[1] <= outer[1] and outer[2] <= inner[2] and inner[3] <= outer[3]
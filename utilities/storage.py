@@ -0,0 +1,451 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+import pandas as pd
+import utilities
+import utilities.snapshot
+from utilities.dataset import PLACES_COLUMNS, ACTIVITIES_COLUMNS
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS places (
+    waypoint     TEXT PRIMARY KEY,
+    latitude     REAL,
+    longitude    REAL,
+    altitude     INTEGER,
+    category     TEXT
+);
+CREATE TABLE IF NOT EXISTS activities (
+    id           INTEGER PRIMARY KEY,
+    label        TEXT,
+    category     TEXT,
+    grade        TEXT,
+    date         TEXT,
+    days         REAL,
+    context      TEXT,
+    role         TEXT,
+    waypoints    TEXT,
+    participants INTEGER,
+    topo         TEXT,
+    comments     TEXT
+);
+-- Never queried, filters run in memory: dropped from files migrated before
+DROP TABLE IF EXISTS activity_waypoints;
+DROP INDEX IF EXISTS places_category;
+DROP INDEX IF EXISTS activities_date;
+DROP INDEX IF EXISTS activities_category;
+'''
+
+
+#------------------------------------------------------------------------------------------------------------
+def sql_value(value):
+    '''
+    numpy scalars and missing values to what sqlite3 can bind
+    '''
+
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+#------------------------------------------------------------------------------------------------------------
+def json_value(value):
+    '''
+    numpy scalars to what json can dump
+    '''
+
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def atomic_write(
+    path : str,
+    write,
+):
+    '''
+    write(tmp_path) then rename over path: readers see the old file or the new one, never half of it
+    '''
+
+    tmp = path + '.tmp'
+    write(tmp)
+
+    with open(tmp, 'rb') as file:
+        os.fsync(file.fileno())
+
+    os.replace(tmp, path)
+
+
+#------------------------------------------------------------------------------------------------------------
+class WriteConflict(Exception):
+    '''
+    The row being saved was changed by another worker since the data was loaded. dataset: current data.
+    '''
+
+    def __init__(self, dataset):
+        super().__init__('Saved meanwhile by someone else')
+        self.dataset = dataset
+
+
+class FileLock:
+    '''
+    Exclusive lock on a file, shared by all processes (gunicorn workers) and threads
+    '''
+
+    def __init__(
+        self,
+        path     : str,
+        blocking = True
+    ):
+        self.path = path
+        self.blocking = blocking
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.file.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+#------------------------------------------------------------------------------------------------------------
+class Coordinated:
+    '''
+    Write coordination between workers: saves run under a file lock and bump a stamp file,
+    datasets remember the stamp they were loaded from.
+    '''
+
+    lock_path  = 'data.lock'
+    stamp_path = 'data.stamp'
+
+    def fingerprint(self) -> tuple:
+        '''
+        Changes whenever the data changed: stamp of the last save, and data files mtimes in case
+        they were edited by hand
+        '''
+
+        mtimes = []
+        for path in self.files():
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+
+        return (self.stamp(), tuple(mtimes))
+
+    def stamp(self) -> str:
+        try:
+            with open(self.stamp_path) as file:
+                return file.read()
+        except OSError:
+            return ''
+
+    def bump(self) -> str:
+
+        stamp = f'{time.time_ns():016x}-{uuid.uuid4().hex[:8]}'
+
+        def write(path):
+            with open(path, 'w') as file:
+                file.write(stamp)
+
+        atomic_write(self.stamp_path, write)
+
+        return stamp
+
+    def commit(
+        self,
+        base   : utilities.Dataset,
+        changed,
+        update,
+        save,
+    ) -> utilities.Dataset:
+        '''
+        Optimistic concurrency: update (Dataset -> Dataset) is applied to base and saved, under the lock.
+        If another worker saved since base was loaded, it is applied to the current data instead, unless
+        changed(dataset) - the row being saved - differs between the two: WriteConflict.
+        '''
+
+        with FileLock(self.lock_path):
+
+            current = base
+            if base.stamp != self.stamp():
+                current = self.load(base.metadata)
+                if changed(current) != changed(base):
+                    raise WriteConflict(current)
+
+            dataset = update(current)
+            save(dataset)
+            dataset.stamp = self.bump()
+
+        return dataset
+
+
+#------------------------------------------------------------------------------------------------------------
+class JsonStorage(Coordinated):
+    '''
+    Default storage: one json snapshot file per table, plus a journal (json lines) of the saves made
+    since. Each save appends one fsync'd line; every compact_every saves the snapshots are rewritten
+    in the background and the journal is started over.
+    The json files are also compiled to a binary snapshot (see utilities.snapshot), read at startup instead.
+    '''
+
+    def __init__(
+        self,
+        activities    = 'data_activities.json',
+        places        = 'data_places.json',
+        journal       = 'data_journal.jsonl',
+        compact_every = 100,
+        snapshot      = 'data_snapshot',
+    ):
+        self.activities = activities
+        self.places = places
+        self.journal = journal
+        self.compact_every = compact_every
+        self.snapshot = snapshot
+        self.lock = threading.Lock()
+        self.compaction = None
+
+    def files(self) -> list:
+        return [self.places, self.activities] + self.journals()
+
+    def journals(self) -> list:
+        '''
+        Journal being compacted (if any) then the current one, in replay order
+        '''
+        return [self.journal + '.compacting', self.journal]
+
+    def load(
+        self,
+        metadata: dict
+    ) -> utilities.Dataset:
+
+        stamp = self.stamp()
+        dataset = self.load_files(metadata).replay(utilities.read_journal(self.journals()))
+        dataset.stamp = stamp
+
+        # Compaction interrupted (process stopped): finish it, unless someone is writing.
+        # Replaying a save twice is harmless.
+        if os.path.exists(self.journal + '.compacting') and not self.compacting():
+            self.compact(dataset, blocking=False)
+
+        return dataset
+
+    def load_files(
+        self,
+        metadata: dict
+    ) -> utilities.Dataset:
+        '''
+        Data of the json files: from the binary snapshot when it is up to date, otherwise parsed then
+        compiled to a new snapshot (unless someone is writing, the next start will)
+        '''
+
+        sources = [self.places, self.activities]
+
+        dataset = utilities.snapshot.read(self.snapshot, sources, metadata)
+        if dataset is not None:
+            return dataset
+
+        state = utilities.snapshot.sources_state(sources)
+        dataset = utilities.load_data(metadata, self.activities, self.places)
+
+        try:
+            with FileLock(self.lock_path, blocking=False):
+                utilities.snapshot.write(dataset, self.snapshot, state)
+        except BlockingIOError:
+            pass
+
+        return dataset
+
+    def compacting(self) -> bool:
+        return self.compaction is not None and self.compaction.is_alive()
+
+    def append(
+        self,
+        dataset: utilities.Dataset,
+        table  : str,
+        row    : dict,
+    ):
+        '''
+        Record one upsert in the journal, durable when this returns. Called under data.lock (see commit),
+        so the lines of the journal count the saves of every worker since the last compaction.
+        '''
+
+        line = json.dumps({'table': table, 'row': row}, default=json_value) + '\n'
+
+        with self.lock:
+            utilities.misc.drop_torn_line(self.journal)
+            with open(self.journal, 'a') as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+            with open(self.journal, 'rb') as file:
+                saves = sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 16), b''))
+
+            # Compaction: the journal is set aside, saves from now on go to a new one
+            if saves >= self.compact_every and not self.compacting() and not os.path.exists(self.journal + '.compacting'):
+                os.replace(self.journal, self.journal + '.compacting')
+                self.compaction = threading.Thread(target=self.compact, args=(dataset,))
+                self.compaction.start()
+
+    def compact(
+        self,
+        dataset : utilities.Dataset,
+        blocking = True,
+    ):
+        '''
+        Write the snapshots (dataset includes every save of the journal set aside), then drop that journal
+        '''
+
+        try:
+            with FileLock(self.lock_path, blocking):
+                if os.path.exists(self.journal + '.compacting'):
+                    atomic_write(self.places, dataset.save_places)
+                    atomic_write(self.activities, dataset.save_activities)
+                    utilities.snapshot.write(dataset, self.snapshot, utilities.snapshot.sources_state([self.places, self.activities]))
+                    os.remove(self.journal + '.compacting')
+        except BlockingIOError:
+            pass
+
+    def save_place(
+        self,
+        dataset : utilities.Dataset,
+        waypoint: str
+    ):
+        place = dataset.places[dataset.places['waypoint']==waypoint][PLACES_COLUMNS].iloc[0]
+        self.append(dataset, 'places', place.astype(object).to_dict())
+
+    def save_activity(
+        self,
+        dataset: utilities.Dataset,
+        id     : int
+    ):
+        self.append(dataset, 'activities', dataset.activity(id))
+
+
+#------------------------------------------------------------------------------------------------------------
+class SqliteStorage(Coordinated):
+    '''
+    Optional storage in a local SQLite file: saves insert/update a single row. Loaded whole like the json
+    files, filters run on the Dataset frames.
+    '''
+
+    def __init__(
+        self,
+        path = 'data.sqlite'
+    ):
+        self.path = path
+
+        with closing(self.connect()) as connection:
+            connection.executescript(SCHEMA)
+
+    def files(self) -> list:
+        return [self.path]
+
+    def connect(self) -> sqlite3.Connection:
+
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA foreign_keys = ON')
+
+        return connection
+
+    def load(
+        self,
+        metadata: dict
+    ) -> utilities.Dataset:
+
+        stamp = self.stamp()
+
+        with closing(self.connect()) as connection:
+            places = pd.read_sql_query('SELECT * FROM places', connection)
+            activities = pd.read_sql_query('SELECT * FROM activities', connection)
+
+        dataset = utilities.Dataset.from_frames(places, activities, metadata)
+        dataset.stamp = stamp
+
+        return dataset
+
+    def save_place(
+        self,
+        dataset : utilities.Dataset,
+        waypoint: str
+    ):
+
+        place = dataset.places[dataset.places['waypoint']==waypoint][PLACES_COLUMNS].iloc[0]
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?)',
+                [sql_value(place[column]) for column in PLACES_COLUMNS]
+            )
+
+    def save_activity(
+        self,
+        dataset: utilities.Dataset,
+        id     : int
+    ):
+
+        activity = dataset.activity(id)
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [sql_value(activity[column]) for column in ACTIVITIES_COLUMNS]
+            )
+
+    def migrate(
+        self,
+        activities = 'data_activities.json',
+        places     = 'data_places.json',
+        journal    = 'data_journal.jsonl',
+    ):
+        '''
+        One-shot import of the json files, including the saves still in their journal
+        '''
+
+        dataset = utilities.load_data(utilities.settings.metadata, activities, places, JsonStorage(activities, places, journal).journals())
+        places = dataset.places[PLACES_COLUMNS]
+        activities = dataset.activities[ACTIVITIES_COLUMNS].sort_values(by='id')
+        activities = activities.assign(date=activities['date'].dt.strftime('%Y-%m-%d'))
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?)',
+                [[sql_value(value) for value in row] for row in places.itertuples(index=False)]
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [[sql_value(value) for value in row] for row in activities.itertuples(index=False)]
+            )
+
+
+#------------------------------------------------------------------------------------------------------------
+def open_storage(
+    sqlite = 'data.sqlite'
+):
+    '''
+    SQLite when its file exists, json files otherwise.
+    Migrate once with: python -c "import utilities; utilities.SqliteStorage().migrate()"
+    '''
+
+    if os.path.exists(sqlite):
+        return SqliteStorage(sqlite)
+
+    return JsonStorage()
+
+
+storage = open_storage()
+
@@ -0,0 +1,199 @@
+import functools
+import gzip
+import hashlib
+import json
+import flask
+import pandas as pd
+import plotly.io as pio
+from dash.exceptions import PreventUpdate
+from utilities.cache import figure_cache
+from utilities.datastore import VERSION_FORMAT
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MINIMUM_SIZE = 1024     # bytes, smaller responses are sent as is
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5      # 11 (default) compresses a little better, several times slower
+
+
+#------------------------------------------------------------------------------------------------------------
+def use_json_engine(
+    engine = 'orjson'
+):
+    '''
+    JSON engine of plotly, hence of every Dash response (figures, table records): 'orjson' encodes numpy
+    arrays natively and is several times faster than 'json'. 'auto' picks orjson when installed.
+    '''
+
+    pio.json.config.default_engine = engine
+
+
+def serializable(
+    values: pd.Series
+):
+    '''
+    Column as given to a trace so that orjson encodes it fastest: numpy arrays of numbers, dates (in
+    seconds, written the same by both engines) or fixed-width strings are encoded natively, where a
+    Series of dates or labels is copied and encoded one python object at a time. Labels with missing
+    values stay a list.
+    '''
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[s]')
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy()
+    if values.isna().any():
+        return values.astype(object).tolist()
+
+    return values.to_numpy(dtype=str)
+
+
+#------------------------------------------------------------------------------------------------------------
+def encodings() -> list:
+    '''
+    Content encodings the server can send, preferred first
+    '''
+
+    return (['br'] if brotli else []) + ['gzip']
+
+
+def encode(
+    data    : bytes,
+    encoding: str,
+) -> bytes:
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress(
+    app,
+    minimum_size = MINIMUM_SIZE,
+):
+    '''
+    Compress the json responses of the app (layout, dependencies, callbacks, table pages) with the best
+    encoding the browser accepts (Accept-Encoding): brotli when installed, gzip otherwise
+    '''
+
+    @app.server.after_request
+    def compress_response(response):
+
+        if (
+            response.status_code != 200 or
+            response.mimetype != 'application/json' or
+            response.direct_passthrough or
+            'Content-Encoding' in response.headers
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = flask.request.accept_encodings.best_match(encodings())
+        if encoding is None or response.content_length is None or response.content_length < minimum_size:
+            return response
+
+        response.set_data(encode(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+
+        return response
+
+
+#------------------------------------------------------------------------------------------------------------
+def callback_key(
+    body: bytes
+) -> tuple:
+    '''
+    First output of a callback request (e.g. 'place_map.figure') and the data versions among its inputs
+    and states, None when the body is not a callback request
+    '''
+
+    try:
+        request = json.loads(body)
+        output = request['output'].strip('.').split('...')[0]
+        values = [item.get('value') for item in request.get('inputs', []) + request.get('state', []) if isinstance(item, dict)]
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return None
+
+    versions = sorted({value for value in values if isinstance(value, str) and VERSION_FORMAT.fullmatch(value)})
+
+    return (output, tuple(versions))
+
+
+def cached_view(
+    view,
+    key,
+):
+    '''
+    Flask view whose response is kept in the figure cache under key() (not cached when None), sent with
+    a weak ETag of its content: 304 when the browser already holds it (If-None-Match)
+    '''
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+
+        name, versions, inputs = key() or (None, None, None)
+        if name is None:
+            return view(*args, **kwargs)
+
+        def build():
+            try:
+                response = view(*args, **kwargs)
+            except PreventUpdate:
+                return ('', 204, None, None)
+            data = response.get_data(as_text=True)
+            return (data, response.status_code, response.mimetype, hashlib.sha1(data.encode()).hexdigest()[:20])
+
+        data, status, mimetype, etag = figure_cache.get_or_build(name, versions, inputs, build)
+
+        if etag is None:
+            return flask.Response(data, status=status)
+        if flask.request.if_none_match.contains_weak(etag):
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(data, status=status, mimetype=mimetype)
+
+        # Weak: the same content is sent compressed or not
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+
+        return response
+
+    return wrapper
+
+
+def cache_responses(
+    app,
+    version,
+    outputs: set,
+):
+    '''
+    Serve the layout, the dependencies and the callbacks of outputs from the figure cache, with ETags.
+    Only for data that does not change under a version (version() for the layout, the store versions
+    within the request body of callbacks): callbacks of outputs must only depend on their request.
+    Browsers revalidate (Cache-Control: no-cache) and get a 304 when the content did not change.
+    '''
+
+    prefix = app.config.routes_pathname_prefix
+    views = app.server.view_functions
+
+    # Keyed by the data versions of the request too: expiring a version drops its responses
+    def callback_response_key():
+        body = flask.request.get_data()
+        output, versions = callback_key(body) or (None, ())
+        if output not in outputs or not versions:
+            return None
+        return ('response:callback', versions, (hashlib.sha1(body).hexdigest(),))
+
+    keys = {
+        '_dash-layout'          : lambda: ('response:layout', (version(),), ()),
+        '_dash-dependencies'    : lambda: ('response:dependencies', (), ()),
+        '_dash-update-component': callback_response_key,
+    }
+    for name, key in keys.items():
+        views[prefix + name] = cached_view(views[prefix + name], key)
@@ -0,0 +1,223 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import flask
+import utilities
+
+
+WORKERS = 4
+ATTEMPTS = 3
+RETRY_DELAY = 30
+
+
+#------------------------------------------------------------------------------------------------------------
+def layout_values(
+    layout: dict
+) -> dict:
+    '''
+    Initial value of every property of the components with an id, from the serialized layout:
+    {'component_id.property': value}
+    '''
+
+    values = {}
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, dict):
+            if 'type' in node and 'props' in node:
+                props = node['props']
+                if isinstance(props.get('id'), str):
+                    values.update({f"{props['id']}.{key}": value for key, value in props.items()})
+                node = props
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    walk(value)
+
+    walk(layout)
+
+    return values
+
+
+def callback_request(
+    dependency: dict,
+    values    : dict,
+    changed   : list,
+) -> dict:
+    '''
+    Body of the request the browser sends to run the callback of dependency with values
+    '''
+
+    def props(dependencies):
+        return [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in dependencies]
+
+    outputs = [
+        {'id': output.rsplit('.', 1)[0], 'property': output.rsplit('.', 1)[1].split('@')[0]}
+        for output in dependency['output'].strip('.').split('...')
+    ]
+
+    return {
+        'output'        : dependency['output'],
+        'outputs'       : outputs if dependency['output'].startswith('..') else outputs[0],
+        'inputs'        : props(dependency['inputs']),
+        'state'         : props(dependency['state']),
+        'changedPropIds': changed,
+    }
+
+
+#------------------------------------------------------------------------------------------------------------
+class WarmUp:
+    '''
+    Cache warm-up of a worker: replays the requests of a first visit, in each language, so that the
+    figure cache (and the response cache when deployed) holds the default figures before anyone asks
+    '''
+
+    def __init__(
+        self,
+        workers     = WORKERS,
+        attempts    = ATTEMPTS,
+        retry_delay = RETRY_DELAY,
+    ):
+        self.workers = workers
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.attempt = 0
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        '''
+        Every request of the last attempt succeeded
+        '''
+        return self.finished is not None and self.failed == 0
+
+    def status(self) -> dict:
+
+        with self.lock:
+            return {
+                'ready'  : self.ready,
+                'attempt': self.attempt,
+                'done'   : self.done,
+                'failed' : self.failed,
+                'total'  : self.total,
+                'seconds': round((self.finished or time.time()) - self.started, 3) if self.started else None,
+            }
+
+    def request(
+        self,
+        server,
+        method: str,
+        path  : str,
+        body  = None,
+    ):
+
+        try:
+            response = server.test_client().open(path, method=method, json=body)
+            failed = response.status_code not in (200, 204)
+            if failed:
+                print(f'Error in warm_up: {method} {path} returned {response.status_code}')
+        except Exception as error:
+            print('Error in warm_up: ', repr(error))
+            response, failed = None, True
+
+        with self.lock:
+            self.done += 1
+            self.failed += failed
+
+        return response
+
+    def run(
+        self,
+        app,
+        pages: dict,
+    ):
+        '''
+        Warm-up attempts, retry_delay seconds apart, until one succeeds (attempts at most)
+        '''
+
+        for attempt in range(1, self.attempts + 1):
+
+            with self.lock:
+                self.attempt = attempt
+                self.done = self.failed = 0
+
+            try:
+                self.replay(app, pages)
+            except Exception as error:
+                print('Error in warm_up: ', repr(error))
+                with self.lock:
+                    self.failed += 1
+
+            if not self.failed:
+                break
+            if attempt < self.attempts:
+                time.sleep(self.retry_delay)
+
+        with self.lock:
+            self.finished = time.time()
+
+    def replay(
+        self,
+        app,
+        pages: dict,
+    ):
+        '''
+        Layout and dependencies first (the data is loaded then), then the callbacks of pages in a thread pool
+        '''
+
+        prefix = app.config.routes_pathname_prefix
+        languages = utilities.LANGUAGES
+
+        with self.lock:
+            self.total = 2 + len(pages) * len(languages)
+
+        layout = self.request(app.server, 'GET', prefix + '_dash-layout')
+        dependencies = self.request(app.server, 'GET', prefix + '_dash-dependencies')
+        if layout is None or dependencies is None or layout.status_code != 200 or dependencies.status_code != 200:
+            return
+
+        values = layout_values(json.loads(layout.get_data()))
+        dependencies = {
+            dependency['output'].strip('.').split('...')[0]: dependency
+            for dependency in json.loads(dependencies.get_data())
+        }
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='warm_up') as pool:
+            for language in languages:
+                for output, page in pages.items():
+                    shown = dict(values, **page, **{'language.children': language})
+                    changed = [prop for prop in [*page, 'language.children'] if values.get(prop) != shown[prop]]
+                    body = callback_request(dependencies[output], shown, changed)
+                    pool.submit(self.request, app.server, 'POST', prefix + '_dash-update-component', body)
+
+    def start(
+        self,
+        app,
+        pages: dict,
+    ):
+        '''
+        Warm-up in the background, once all callbacks and request handlers are registered. pages: for each
+        output to precompute, the values that show it ({'navigation_segments.value': 'stats', ...}),
+        the other inputs keep their default. Progress on /ready: 200 once every request succeeded, 503 until
+        then, and for good when the last attempt still had failures (their count is in the status).
+        '''
+
+        @app.server.route('/ready')
+        def serve_ready():
+
+            status = self.status()
+
+            return flask.Response(json.dumps(status), status=200 if status['ready'] else 503, mimetype='application/json')
+
+        self.started = time.time()
+        threading.Thread(target=self.run, args=(app, pages), name='warm_up', daemon=True).start()
+
+
+warm_up = WarmUp()